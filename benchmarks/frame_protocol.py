@@ -0,0 +1,76 @@
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+import numpy as np
+
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, repo_root)
+sys.path.insert(0, os.path.join(repo_root, 'software'))
+import RayTracer
+from Octree import Octree
+from frame_protocol import ENCODINGS, FrameEncoder, FrameReceiver
+
+# Bytes and latency per frame for each frame encoding, on a short walk through
+# house.mem rendered by the software renderer (what the FPGA sends, minus noise).
+
+link_bits_per_second = 100e6  # PYNQ Z1 Ethernet
+
+
+def renderWalk(frames, size):
+    scene = Octree.fromMem(os.path.join(repo_root, 'rtl', 'house.mem'))
+    walk = []
+    for i in range(frames):
+        camera = {"camera_pos": [250, 512, 5 * i], "camera_front": [0, 0, 230], "right_vector": [1, 0, 0], "up_vector": [0, 1, 0]}
+        walk.append(RayTracer.render(scene, camera, size, size, step_mode='dda'))
+    return walk
+
+
+def measure(walk, encoding):
+    encoder = FrameEncoder(encoding)
+    sender, receiver_socket = socket.socketpair()
+    receiver = FrameReceiver(receiver_socket, walk[0].shape[1], walk[0].shape[0])
+    sizes, encode_ms, latency_ms = [], [], []
+    sent_at = {}
+
+    def send():
+        for frame_id, frame in enumerate(walk):
+            start = time.perf_counter()
+            data = encoder.encode(frame, frame_id)
+            encode_ms.append((time.perf_counter() - start) * 1000)
+            sizes.append(len(data))
+            sent_at[frame_id] = start
+            sender.sendall(data)
+        sender.close()
+
+    thread = threading.Thread(target=send)
+    thread.start()
+    while True:
+        frame = receiver.receive()
+        if frame is None:
+            break
+        latency_ms.append((time.perf_counter() - sent_at[receiver.frame_id]) * 1000)
+        assert np.array_equal(frame, walk[receiver.frame_id])
+    thread.join()
+    receiver_socket.close()
+    return np.mean(sizes), np.mean(encode_ms), np.mean(latency_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare frame encodings")
+    parser.add_argument('--frames', type=int, default=6)
+    parser.add_argument('--size', type=int, default=512)
+    args = parser.parse_args()
+
+    walk = renderWalk(args.frames, args.size)
+    for encoding in ENCODINGS:
+        size, encode_ms, latency_ms = measure(walk, encoding)
+        wire_ms = size * 8 / link_bits_per_second * 1000
+        print(f"{encoding:6s} {size / 1024:8.1f} KiB/frame  encode {encode_ms:6.1f} ms  loopback encode+send+decode {latency_ms:6.1f} ms  at 100 Mbit {wire_ms:6.1f} ms on the wire")
+
+
+if __name__ == "__main__":
+    main()
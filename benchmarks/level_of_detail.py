@@ -0,0 +1,57 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, repo_root)
+sys.path.insert(0, os.path.join(repo_root, 'software'))
+import RayTracerBatch
+from Octree import Octree
+from camera_presets import camera_settings
+
+# Node reads, stepping iterations and time per frame with the level of detail
+# cutoff (renderFrame lod) at a few pixel footprints, against full-depth
+# traversal, and how many pixels of the image change, over the gui.py presets
+# and a wide view from the edge of the world. The leaves of the FPGA scenes are
+# 32 voxels or more, so the cutoff mostly pays off on finer scenes, e.g. ones
+# from Voxelizer.py:
+#   python benchmarks/level_of_detail.py model.mem --lod 1 2
+
+wide_camera = {"camera_pos": [512, 512, 0], "camera_front": [0, 0, 100], "right_vector": [1, 0, 0], "up_vector": [0, 1, 0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare level of detail cutoffs with full-depth traversal")
+    parser.add_argument('scenes', nargs='*', default=[os.path.join(repo_root, 'rtl', scene) for scene in ['dog.mem', 'house.mem']])
+    parser.add_argument('--size', type=int, default=256, help="image width and height")
+    parser.add_argument('--lod', type=float, nargs='+', default=[0.5, 1, 2, 4], help="footprints in pixels")
+    parser.add_argument('--shading', action='store_true')
+    parser.add_argument('--step-mode', choices=['hardware', 'dda'], default='hardware')
+    args = parser.parse_args()
+
+    cameras = dict(camera_settings, **{"Wide": wide_camera})
+    for path in args.scenes:
+        scene = os.path.basename(path)
+        octree = Octree.load(path)
+        octree.dominantMaterials()  # built once per scene, not part of the frame times
+        for preset, camera in cameras.items():
+            view = [np.array(camera[key]) for key in ("camera_pos", "camera_front", "up_vector", "right_vector")]
+            results = []
+            for lod in [None] + args.lod:
+                stats = {}
+                start = time.perf_counter()
+                image = RayTracerBatch.renderFrame(octree, octree.materials, *view, args.size, args.size, shading=args.shading,
+                                                   step_mode=args.step_mode, stats=stats, lod=lod)
+                results.append((lod, image, stats['levels'].sum(), stats['steps'].sum(), (time.perf_counter() - start) * 1000))
+            _, reference, levels, steps, _ = results[0]
+            for lod, image, lod_levels, lod_steps, elapsed in results[1:]:
+                different = np.any(image != reference, axis=2).mean()
+                print(f"{scene:10s} {preset:14s} lod {lod:4g}  reads {levels:8d} -> {lod_levels:8d} ({(1 - lod_levels / levels) * 100:5.1f}% fewer)  "
+                      f"steps {steps:8d} -> {lod_steps:8d}  {results[0][4]:6.0f} -> {elapsed:6.0f} ms  {different * 100:5.2f}% of pixels differ")
+
+
+if __name__ == "__main__":
+    main()
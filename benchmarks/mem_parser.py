@@ -0,0 +1,130 @@
+import argparse
+import importlib.util
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(repo_root, 'software'))
+from Octree import LEAF_FLAG, MATERIAL_MASK, Octree
+
+spec = importlib.util.spec_from_file_location('mem_parser', os.path.join(repo_root, 'mem-parser.py'))
+mem_parser = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mem_parser)
+
+# Throughput of mem-parser.py on Unity style dumps of generated octrees, next
+# to the previous three pass version (line numbered copy, readlines twice,
+# substring tests per line), which is kept here for comparison.
+
+# house.mem also uses ids with no Unity material in mem-parser.py, give them made up names
+materials = dict(mem_parser.default_materials)
+materials.update({f"Material{material} (Instance)": material for material in range(6, 8)})
+material_names = {material: name for name, material in materials.items()}
+
+
+def randomOctree(nodes, seed=0):
+    # Breadth first words of a random octree with about this many nodes, built
+    # a level at a time
+    rng = np.random.default_rng(seed)
+    words = [np.array([1], dtype=np.uint32)]
+    count = 1
+    internal_before = 1  # the root pointer
+    internal = 1
+    while internal:
+        children = rng.random(8 * internal) < (0.2 if count < nodes else 0)
+        level = np.where(children, 0, mem_parser.LEAF_PREFIX | rng.integers(0, 6, 8 * internal)).astype(np.uint32)
+        level[children] = 1 + 8 * (internal_before + np.arange(children.sum()))
+        words.append(level)
+        count += len(level)
+        internal = int(children.sum())
+        internal_before += internal
+    return np.concatenate(words)
+
+
+def writeDump(words, file):
+    # Unity numbers nodes depth first while building, so give every line a
+    # node index that is not its line number
+    node_index = np.random.default_rng(1).permutation(len(words))
+    for line, word in enumerate(words.tolist()):
+        if word & LEAF_FLAG:
+            file.write(f"Node {node_index[line]}: Material ID = {material_names[word & MATERIAL_MASK]}, MID1 = False\n")
+        else:
+            file.write(f"Node {node_index[line]}: Material ID = None, MID1 = False, First Child Index = {node_index[word]}\n")
+
+
+def oldParser(input_file, directory):
+    intermediate_file = os.path.join(directory, 'intermediate.txt')
+    final_output_file = os.path.join(directory, 'old.mem')
+    with open(input_file, 'r') as file:
+        lines = file.readlines()
+    with open(intermediate_file, 'w') as file:
+        for i, line in enumerate(lines):
+            file.write(f"{i}: {line}")
+
+    node_to_line_index = {}
+    with open(intermediate_file, 'r') as file:
+        lines = file.readlines()
+    for i, line in enumerate(lines):
+        parts = line.split(':')
+        node_to_line_index[int(parts[1].split()[1])] = i
+
+    names = [(f"Material ID = {name}", f"FFFFFFF{material}\n") for name, material in mem_parser.default_materials.items()]
+    with open(final_output_file, 'w') as file:
+        for line_content in lines:
+            if "First Child Index" in line_content:
+                first_child_index = int(line_content.split('First Child Index = ')[1].strip())
+                updated_line = f"{node_to_line_index[first_child_index]:08x}\n"
+            else:
+                for name, word in names:
+                    if name in line_content:
+                        updated_line = word
+            file.write(updated_line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure mem-parser.py throughput")
+    parser.add_argument('--nodes', type=int, default=2_000_000, help="approximate node count of the generated octree")
+    parser.add_argument('--skip-old', action='store_true', help="only time the streaming parser")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Round trip house.mem through a dump first
+        house = Octree.fromMem(os.path.join(repo_root, 'rtl', 'house.mem'))
+        dump = io.StringIO()
+        writeDump(house.nodes, dump)
+        dump.seek(0)
+        output = io.StringIO()
+        mem_parser.convert(dump, materials, hex_file=output)
+        with open(os.path.join(repo_root, 'rtl', 'house.mem')) as file:
+            assert output.getvalue() == file.read(), "house.mem does not round trip"
+        print("house.mem round trips byte for byte")
+
+        words = randomOctree(args.nodes)
+        input_file = os.path.join(directory, 'octree_output.txt')
+        with open(input_file, 'w') as file:
+            writeDump(words, file)
+        size = os.path.getsize(input_file)
+        print(f"{len(words)} nodes, {size / 1e6:.1f} MB dump")
+
+        start = time.perf_counter()
+        with open(input_file) as lines, open(os.path.join(directory, 'new.mem'), 'w') as hex_file, open(os.path.join(directory, 'new.bin'), 'wb') as binary_file:
+            mem_parser.convert(lines, hex_file=hex_file, binary_file=binary_file)
+        elapsed = time.perf_counter() - start
+        print(f"streaming  {elapsed:6.2f} s  {size / elapsed / 1e6:6.1f} MB/s  (hex and binary)")
+        assert np.array_equal(np.fromfile(os.path.join(directory, 'new.bin'), dtype='<u4'), words)
+
+        if not args.skip_old:
+            start = time.perf_counter()
+            oldParser(input_file, directory)
+            elapsed = time.perf_counter() - start
+            print(f"old        {elapsed:6.2f} s  {size / elapsed / 1e6:6.1f} MB/s")
+            with open(os.path.join(directory, 'old.mem')) as old, open(os.path.join(directory, 'new.mem')) as new:
+                assert old.read().upper().split() == new.read().upper().split()
+
+
+if __name__ == "__main__":
+    main()
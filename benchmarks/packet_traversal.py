@@ -0,0 +1,46 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, repo_root)
+sys.path.insert(0, os.path.join(repo_root, 'software'))
+import RayTracerBatch
+from Octree import Octree
+from camera_presets import camera_settings
+
+# traverseTree calls, octree node reads and time per frame of per-ray lookups
+# against packets of neighbouring rays that share them (traversePackets), on
+# the FPGA scenes from the gui.py presets. The images have to be identical.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-ray and packet traversal")
+    parser.add_argument('--size', type=int, default=256, help="image width and height")
+    parser.add_argument('--packet', type=int, default=8, help="packet width and height in pixels")
+    parser.add_argument('--step-mode', choices=['hardware', 'dda'], default='hardware')
+    args = parser.parse_args()
+
+    for scene in ['dog.mem', 'house.mem']:
+        octree = Octree.load(os.path.join(repo_root, 'rtl', scene))
+        for preset, camera in camera_settings.items():
+            view = [np.array(camera[key]) for key in ("camera_pos", "camera_front", "up_vector", "right_vector")]
+            images, stats, times = [], [], []
+            for packet_size in (None, args.packet):
+                stats.append({})
+                start = time.perf_counter()
+                images.append(RayTracerBatch.renderFrame(octree, octree.materials, *view, args.size, args.size, step_mode=args.step_mode,
+                                                         stats=stats[-1], packet_size=packet_size))
+                times.append((time.perf_counter() - start) * 1000)
+            assert np.array_equal(images[0], images[1]), f"{scene} {preset}: packet traversal changed the image"
+            lookups, levels = stats[0]['lookups'].sum(), stats[0]['levels'].sum()
+            packet_lookups, packet_levels = stats[1]['packet_lookups'].sum(), stats[1]['packet_levels'].sum()
+            print(f"{scene:10s} {preset:14s} calls {lookups:7d} -> {packet_lookups:7d} ({(1 - packet_lookups / lookups) * 100:4.1f}% fewer)  "
+                  f"reads {levels:8d} -> {packet_levels:7d} ({(1 - packet_levels / levels) * 100:4.1f}% fewer)  {times[0]:6.0f} -> {times[1]:6.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
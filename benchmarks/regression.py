@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, repo_root)
+sys.path.insert(0, os.path.join(repo_root, 'software'))
+import RayTracer
+from Octree import Octree
+from camera_presets import camera_settings
+
+# Renders every FPGA scene from every gui.py camera preset, and from a scene
+# view camera that frames it (some presets see nothing of some scenes), with
+# the software ray tracer, times each case and compares the image pixel for
+# pixel with the golden PNG in benchmarks/golden/, so a faster renderer cannot
+# quietly change what it draws. There are goldens for both step modes. Exits
+# with 1 if any golden differs.
+# --rtl also measures how far the output.ppm of rtl/doit.sh is from the software
+# render of the testbench camera, with the ray directions generated like
+# RayGenerator.sv (RayGenerator.py) and the background of RayProcessor.sv. The
+# hits and misses are expected to line up, but the RTL shades and steps in
+# integer arithmetic where the software uses floats and a gamma table, so
+# colours are only expected to be close: the case is reported with the share of
+# pixels beyond --rtl-tolerance and never fails the run.
+#   python benchmarks/regression.py --report report.json
+#   python benchmarks/regression.py --update     (after an intended change)
+
+scenes = ['cubes.mem', 'dog.mem', 'house.mem']
+
+# Framing the occupied part of each scene, so every scene x shading x step mode
+# has a case with real content
+scene_cameras = {
+    'cubes.mem': {"camera_pos": [450, 600, 300], "camera_front": [0, 0, 90], "right_vector": [1, 0, 0], "up_vector": [0, 1, 0]},
+    'dog.mem': {"camera_pos": [144, 240, 0], "camera_front": [0, 0, 60], "right_vector": [1, 0, 0], "up_vector": [0, 1, 0]},
+    'house.mem': {"camera_pos": [450, 600, 300], "camera_front": [0, 0, 90], "right_vector": [1, 0, 0], "up_vector": [0, 1, 0]},
+}
+
+golden_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+
+# Camera, size and scene set in RayTracingUnit_tb.cpp (OctantRom.sv loads house.mem)
+testbench_camera = {"camera_pos": [450, 600, 300], "camera_front": [0, 0, 90], "right_vector": [1, 0, 0], "up_vector": [0, 1, 0]}
+testbench_size = 512
+# RAY_OUT_OF_BOUND colour in RayProcessor.sv
+testbench_background = [155, 150, 105]
+
+
+def caseName(scene, preset, shading, step_mode):
+    # "Preset: Z +ve" -> z_pos
+    slug = re.sub(r'[^a-z0-9]+', '_', preset.lower().replace('preset:', '').replace('+ve', 'pos').replace('-ve', 'neg')).strip('_')
+    return f"{os.path.splitext(scene)[0]}_{slug}_{'shaded' if shading else 'flat'}_{step_mode}"
+
+
+def timedRender(octree, camera, size, shading, step_mode, workers, repeat, hardware_rays=False, background=None):
+    # Best of repeat runs
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        image = RayTracer.render(octree, camera, size, size, shading=shading, workers=workers, step_mode=step_mode, hardware_rays=hardware_rays,
+                                 background=background)
+        times.append(time.perf_counter() - start)
+    return image, min(times)
+
+
+def compare(image, reference):
+    if reference.shape != image.shape:
+        return {'status': 'size mismatch', 'reference_shape': list(reference.shape)}
+    different = np.any(image != reference, axis=2)
+    return {'status': 'match' if not different.any() else 'differs',
+            'pixels_differ': int(different.sum()),
+            'max_channel_difference': int(np.abs(image.astype(np.int16) - reference).max())}
+
+
+def difference(image, reference, tolerance):
+    # How far apart two renders are, for cases not expected to match exactly
+    if reference.shape != image.shape:
+        return {'status': 'size mismatch', 'reference_shape': list(reference.shape)}
+    channel_difference = np.abs(image.astype(np.int16) - reference)
+    beyond = channel_difference.max(axis=2) > tolerance
+    return {'status': 'compared', 'tolerance': tolerance,
+            'pixels_differ': int(np.any(channel_difference > 0, axis=2).sum()),
+            'pixels_beyond_tolerance': int(beyond.sum()),
+            'share_beyond_tolerance': float(beyond.mean()),
+            'mean_channel_difference': float(channel_difference.mean()),
+            'max_channel_difference': int(channel_difference.max())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Golden image regression and timing of the software ray tracer")
+    parser.add_argument('--size', type=int, default=256, help="image width and height (the goldens are 256)")
+    parser.add_argument('--shading', choices=['flat', 'shaded', 'both'], default='both')
+    parser.add_argument('--step-mode', choices=['hardware', 'dda'], default='hardware')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=1, help="renders per case, the fastest is reported")
+    parser.add_argument('--golden', default=golden_directory, metavar='DIR', help="directory of golden PNGs")
+    parser.add_argument('--update', action='store_true', help="write the renders as the new golden images")
+    parser.add_argument('--rtl', metavar='PPM', help="output.ppm from rtl/doit.sh to compare with the testbench camera")
+    parser.add_argument('--rtl-tolerance', type=int, default=16, metavar='N', help="largest channel difference from the RTL output counted as close")
+    parser.add_argument('--report', metavar='PATH', help="write the results as JSON")
+    args = parser.parse_args()
+
+    shadings = {'flat': [False], 'shaded': [True], 'both': [False, True]}[args.shading]
+    cases = []
+    for scene in scenes:
+        octree = Octree.load(os.path.join(repo_root, 'rtl', scene))
+        for preset, camera in dict(camera_settings, **{"Scene view": scene_cameras[scene]}).items():
+            for shading in shadings:
+                name = caseName(scene, preset, shading, args.step_mode)
+                image, elapsed = timedRender(octree, camera, args.size, shading, args.step_mode, args.workers, args.repeat)
+                golden_path = os.path.join(args.golden, name + '.png')
+                if args.update:
+                    os.makedirs(args.golden, exist_ok=True)
+                    Image.fromarray(image, 'RGB').save(golden_path)
+                    result = {'status': 'updated'}
+                elif os.path.exists(golden_path):
+                    result = compare(image, np.array(Image.open(golden_path).convert('RGB')))
+                else:
+                    result = {'status': 'no golden'}
+                cases.append({'name': name, 'scene': scene, 'preset': preset, 'shading': shading, 'seconds': elapsed,
+                              'rays_per_second': args.size * args.size / elapsed, **result})
+                print(f"{name:32s} {elapsed * 1000:9.1f} ms  {result['status']}"
+                      + (f" ({result['pixels_differ']} pixels)" if result['status'] == 'differs' else ""))
+
+    if args.rtl:
+        octree = Octree.load(os.path.join(repo_root, 'rtl', 'house.mem'))
+        image, elapsed = timedRender(octree, testbench_camera, testbench_size, True, 'hardware', args.workers, 1, hardware_rays=True,
+                                     background=testbench_background)
+        result = difference(image, np.array(Image.open(args.rtl).convert('RGB')), args.rtl_tolerance)
+        cases.append({'name': 'rtl_testbench', 'scene': 'house.mem', 'preset': 'RayTracingUnit_tb.cpp', 'shading': True, 'seconds': elapsed,
+                      'rays_per_second': testbench_size * testbench_size / elapsed, **result})
+        print(f"{'rtl_testbench':32s} {elapsed * 1000:9.1f} ms  {result['status']}"
+              + (f" ({result['share_beyond_tolerance'] * 100:.2f}% of pixels more than {args.rtl_tolerance} apart, "
+                 f"mean channel difference {result['mean_channel_difference']:.2f})" if result['status'] == 'compared' else ""))
+
+    # The RTL case is a measurement, only the goldens can fail the run
+    # A case without a golden checks nothing, so it fails too (run --update first)
+    failed = [case['name'] for case in cases if case['name'] != 'rtl_testbench' and case['status'] in ('differs', 'size mismatch', 'no golden')]
+    total = sum(case['seconds'] for case in cases)
+    print(f"{len(cases)} cases in {total:.1f} s, {len(failed)} differ")
+    if args.report:
+        report = {'size': args.size, 'step_mode': args.step_mode, 'workers': args.workers, 'repeat': args.repeat,
+                  'total_seconds': total, 'failed': failed, 'cases': cases}
+        with open(args.report, 'w') as file:
+            json.dump(report, file, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
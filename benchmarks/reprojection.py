@@ -0,0 +1,57 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, repo_root)
+sys.path.insert(0, os.path.join(repo_root, 'software'))
+import RayTracerBatch
+from Octree import Octree
+from Reprojection import Reprojector
+
+# Walks the camera a few units and a fraction of a degree per frame and
+# compares each reprojected frame with a full render of the same camera: share
+# of pixels reused, time per frame and how many pixels differ.
+
+
+def rotateY(vector, degrees):
+    angle = np.radians(degrees)
+    x, y, z = vector
+    return np.array([x * np.cos(angle) + z * np.sin(angle), y, -x * np.sin(angle) + z * np.cos(angle)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Temporal reprojection against full renders along a camera walk")
+    parser.add_argument('scene', nargs='?', default=os.path.join(repo_root, 'rtl', 'house.mem'))
+    parser.add_argument('--size', type=int, default=256, help="image width and height")
+    parser.add_argument('--frames', type=int, default=10)
+    parser.add_argument('--move', type=float, default=5, help="camera movement along z per frame")
+    parser.add_argument('--turn', type=float, default=0.5, help="camera rotation about y per frame in degrees")
+    parser.add_argument('--max-error', type=float, default=1.0)
+    parser.add_argument('--shading', action='store_true')
+    parser.add_argument('--step-mode', choices=['hardware', 'dda'], default='dda')
+    args = parser.parse_args()
+
+    octree = Octree.load(args.scene)
+    reprojector = Reprojector(octree, args.size, args.size, args.shading, args.step_mode, max_error=args.max_error)
+    for frame in range(args.frames):
+        camera = {"camera_pos": np.array([450, 600, 300 + args.move * frame]).round().astype(int),
+                  "camera_front": rotateY([0, 0, 100], args.turn * frame),
+                  "right_vector": rotateY([1, 0, 0], args.turn * frame), "up_vector": np.array([0, 1, 0])}
+        start = time.perf_counter()
+        image = reprojector.render(camera)
+        reprojected = (time.perf_counter() - start) * 1000
+        view = [np.asarray(camera[key]) for key in ("camera_pos", "camera_front", "up_vector", "right_vector")]
+        start = time.perf_counter()
+        reference = RayTracerBatch.renderFrame(octree, octree.materials, *view, args.size, args.size, shading=args.shading, step_mode=args.step_mode)
+        full = (time.perf_counter() - start) * 1000
+        different = np.any(image != reference, axis=2)
+        print(f"frame {frame:3d}  reused {reprojector.reused * 100:5.1f}%  {reprojected:7.1f} ms (full render {full:7.1f} ms)  "
+              f"{different.mean() * 100:5.2f}% of pixels differ")
+
+
+if __name__ == "__main__":
+    main()
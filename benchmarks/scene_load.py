@@ -0,0 +1,47 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(repo_root, 'software'))
+import RayTracerBatch
+import SceneConvert
+from Octree import Octree
+from mem_parser import randomOctree
+
+# Time to first frame from a .mem file (parsed into a NumPy array) and from a
+# binary scene file (memory mapped, only the pages rays touch are read) for a
+# generated octree.
+
+view = (np.array([512, 512, 0]), np.array([0, 0, 100]), np.array([0, 1, 0]), np.array([1, 0, 0]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare loading .mem and binary scene files")
+    parser.add_argument('--nodes', type=int, default=10_000_000, help="approximate node count of the generated octree")
+    parser.add_argument('--size', type=int, default=64, help="width and height of the first frame")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        mem_path = os.path.join(directory, 'scene.mem')
+        scene_path = os.path.join(directory, 'scene.oct')
+        Octree(randomOctree(args.nodes)).toMem(mem_path)
+        SceneConvert.memToScene(mem_path, scene_path)
+        print(f"{os.path.getsize(scene_path) // 4} nodes, .mem {os.path.getsize(mem_path) / 1e6:.1f} MB, scene {os.path.getsize(scene_path) / 1e6:.1f} MB")
+
+        images = []
+        for label, path in (('.mem', mem_path), ('scene', scene_path)):
+            start = time.perf_counter()
+            octree = Octree.load(path)
+            loaded = time.perf_counter() - start
+            images.append(RayTracerBatch.renderFrame(octree, octree.materials, *view, args.size, args.size))
+            print(f"{label:6s} load {loaded:7.3f} s  first frame {time.perf_counter() - start:7.3f} s")
+        assert np.array_equal(images[0], images[1])
+
+
+if __name__ == "__main__":
+    main()
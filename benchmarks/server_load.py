@@ -0,0 +1,77 @@
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, repo_root)
+import server
+from frame_protocol import FrameReceiver, encode_camera_packet
+from frame_sources import CachedFrameSource, SoftwareFrameSource
+
+# Load test of the TCP path without the board: a server backed by the
+# software renderer (through a frame cache, so the first pass renders and the
+# second only measures the network path) and several clients walking the camera
+# through house.mem, each waiting for its frame before sending the next packet.
+
+
+def walkPackets(frames, client):
+    packets = []
+    for i in range(frames):
+        camera = {"camera_pos": [250 + 10 * client, 512, 5 * i], "camera_front": [0, 0, 230], "right_vector": [1, 0, 0], "up_vector": [0, 1, 0]}
+        packets.append(encode_camera_packet(camera, (30, 30, 30)))
+    return packets
+
+
+def runClient(port, packets, size, latencies):
+    client_socket = socket.create_connection(('127.0.0.1', port))
+    receiver = FrameReceiver(client_socket, size, size)
+    for packet in packets:
+        start = time.perf_counter()
+        client_socket.sendall(packet)
+        if receiver.receive() is None:
+            break
+        latencies.append((time.perf_counter() - start) * 1000)
+    client_socket.close()
+
+
+def runClients(port, clients, frames, size):
+    latencies = [[] for _ in range(clients)]
+    threads = [threading.Thread(target=runClient, args=(port, walkPackets(frames, client), size, latencies[client])) for client in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latency = np.concatenate(latencies)
+    return len(latency) / elapsed, np.mean(latency), np.percentile(latency, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test server.py with the software frame source")
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--frames', type=int, default=8, help="frames per client")
+    parser.add_argument('--size', type=int, default=256)
+    parser.add_argument('--encoding', default='rle')
+    parser.add_argument('--port', type=int, default=12399)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        source = SoftwareFrameSource(os.path.join(repo_root, 'rtl', 'house.mem'), args.size, args.size, step_mode='dda')
+        source = CachedFrameSource(cache_dir, source)
+        threading.Thread(target=server.start_server, args=(source, args.encoding, False, args.port), daemon=True).start()
+        time.sleep(0.5)
+
+        for label in ("rendering", "cached"):
+            fps, mean_ms, p95_ms = runClients(args.port, args.clients, args.frames, args.size)
+            print(f"{label:9s} {args.clients} clients: {fps:7.1f} frames/s total, latency mean {mean_ms:7.1f} ms, p95 {p95_ms:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'software'))
+import RayTracerBatch
+from Octree import Octree
+
+# Steps per ray and time per frame of the hardware-faithful doubling / halving
+# stepRay against the single-step DDA exit, on the FPGA scenes.
+
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+cameras = {
+    "Z +ve": ([250, 512, 0], [0, 0, 100], [0, 1, 0], [1, 0, 0]),
+    "Z -ve": ([250, 512, 760], [0, 0, -100], [0, 1, 0], [-1, 0, 0]),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the hardware and DDA step modes")
+    parser.add_argument('--size', type=int, default=256, help="image width and height")
+    args = parser.parse_args()
+
+    for scene in ['dog.mem', 'house.mem']:
+        octree = Octree.fromMem(os.path.join(repo_root, 'rtl', scene))
+        for name, (cam_pos, cam_norm, cam_up, cam_right) in cameras.items():
+            images = {}
+            for mode in ['hardware', 'dda']:
+                stats = {}
+                start = time.perf_counter()
+                images[mode] = RayTracerBatch.renderFrame(octree, octree.materials, np.array(cam_pos), np.array(cam_norm), np.array(cam_up), np.array(cam_right),
+                                                          args.size, args.size, step_mode=mode, stats=stats)
+                elapsed = (time.perf_counter() - start) * 1000
+                print(f"{scene:10s} {name:6s} {mode:8s} {elapsed:8.1f} ms/frame  "
+                      f"{stats['steps'].mean():7.2f} steps/ray  {stats['lookups'].mean():6.2f} lookups/ray  max {stats['steps'].max()} steps")
+            changed = np.any(images['hardware'] != images['dda'], axis=2).mean() * 100
+            print(f"{'':17s} {changed:.2f}% of pixels differ between modes")
+
+
+if __name__ == "__main__":
+    main()
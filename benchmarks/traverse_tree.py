@@ -0,0 +1,64 @@
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'software'))
+from Octree import Octree, LEAF_FLAG, MATERIAL_MASK
+from RayTracer import traverseTree as traverseTreeBits
+
+# Micro-benchmark of the per-pixel traverseTree: the old binary-string decoding
+# against the Morton table descent RayTracer.traverseTree now uses.
+
+coord_bit_length = 10
+repo_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def toBinaryStr(value, bit_length):
+    return format(value, f'0{bit_length}b')
+
+
+def traverseTreeStrings(ray_pos, octree, oct_size, aabb_min, aabb_max):
+    depth = 0
+    node = int(octree.nodes[0])
+    x_bin = toBinaryStr(ray_pos[0], coord_bit_length)
+    y_bin = toBinaryStr(ray_pos[1], coord_bit_length)
+    z_bin = toBinaryStr(ray_pos[2], coord_bit_length)
+    while not node & LEAF_FLAG and depth < coord_bit_length:
+        octant = int(z_bin[depth] + y_bin[depth] + x_bin[depth], 2)
+        depth += 1
+        oct_size /= 2
+
+        aabb_min = aabb_min + (oct_size * np.array([int(x_bin[depth - 1]), int(y_bin[depth - 1]), int(z_bin[depth - 1])])).astype(int)
+        aabb_max = aabb_min + np.array([oct_size - 1, oct_size - 1, oct_size - 1]).astype(int)
+        node = int(octree.nodes[node + octant])
+    return node & MATERIAL_MASK, oct_size, aabb_min, aabb_max
+
+
+def main():
+    samples = 2000
+    world_size = 2**coord_bit_length
+    world_min = np.array([0, 0, 0], dtype=int)
+    world_max = np.array([world_size - 1, world_size - 1, world_size - 1], dtype=int)
+    positions = np.random.default_rng(0).integers(0, world_size, size=(samples, 3))
+
+    for scene in ['cubes.mem', 'dog.mem', 'house.mem']:
+        octree = Octree.fromMem(os.path.join(repo_root, 'rtl', scene), coord_bit_length)
+
+        for ray_pos in positions:
+            old = traverseTreeStrings(ray_pos, octree, world_size, world_min, world_max)
+            new = traverseTreeBits(ray_pos, octree, world_size, world_min, world_max)
+            assert old[0] == new[0] and old[1] == new[1]
+            assert np.array_equal(old[2], new[2]) and np.array_equal(old[3], new[3])
+
+        times = {}
+        for name, traverse in [('strings', traverseTreeStrings), ('bits', traverseTreeBits)]:
+            run = lambda: [traverse(ray_pos, octree, world_size, world_min, world_max) for ray_pos in positions]
+            times[name] = min(timeit.repeat(run, number=1, repeat=5)) / samples * 1e6
+
+        print(f"{scene:10s} strings: {times['strings']:7.2f} us/lookup  bits: {times['bits']:7.2f} us/lookup  speedup: {times['strings'] / times['bits']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
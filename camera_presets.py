@@ -0,0 +1,40 @@
+# Camera presets shown in the gui.py dropdown, also rendered by
+# benchmarks/regression.py
+camera_settings = {
+    "Preset: Z +ve": {
+        "camera_pos": [250, 512, 0],
+        "camera_front": [0, 0, 100],
+        "right_vector": [1, 0, 0],
+        "up_vector": [0, 1, 0]
+    },
+    "Preset: Z -ve": {
+        "camera_pos": [250, 512, 760],
+        "camera_front": [0, 0, -100],
+        "right_vector": [-1, 0, 0],
+        "up_vector": [0, 1, 0]
+    },
+    "Preset: Y +ve": {
+        "camera_pos": [250, 512, 0],
+        "camera_front": [0, 1, 0],
+        "right_vector": [1, 0, 0],
+        "up_vector": [0, 0, -1]
+    },
+    "Preset: Y -ve": {
+        "camera_pos": [250, 512, 0],
+        "camera_front": [0, -100, 0],
+        "right_vector": [1, 0, 0],
+        "up_vector": [0, 0, 1]
+    },
+    "Preset: X +ve": {
+        "camera_pos": [250, 512, 0],
+        "camera_front": [100, 0, 0],
+        "right_vector": [0, 0, -1],
+        "up_vector": [0, 1, 0]
+    },
+    "Preset: X -ve": {
+        "camera_pos": [250, 512, 0],
+        "camera_front": [-100, 0, 0],
+        "right_vector": [0, 0, 1],
+        "up_vector": [0, 1, 0]
+    }
+}
@@ -0,0 +1,62 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Least recently used frames keyed by scene id and the exact 28-byte camera
+# packet (gp0..gp6), so going back to a preset, the reset camera or an earlier
+# background colour needs no render. The total size of the stored frames is
+# kept under max_bytes by evicting the least recently used ones. Used by
+# server.py (MemoryCachedFrameSource in frame_sources.py) and gui.py.
+
+
+class FrameCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.frames = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, scene_id, packet):
+        # The stored frame (read only), or None
+        key = (scene_id, bytes(packet))
+        with self.lock:
+            frame = self.frames.get(key)
+            if frame is None:
+                self.misses += 1
+                return None
+            self.frames.move_to_end(key)
+            self.hits += 1
+            return frame
+
+    def put(self, scene_id, packet, frame):
+        # Stores a copy, frames bigger than the whole budget are not stored
+        frame = np.array(frame, copy=True)
+        if frame.nbytes > self.max_bytes:
+            return
+        frame.setflags(write=False)
+        key = (scene_id, bytes(packet))
+        with self.lock:
+            old = self.frames.pop(key, None)
+            if old is not None:
+                self.bytes -= old.nbytes
+            self.frames[key] = frame
+            self.bytes += frame.nbytes
+            while self.bytes > self.max_bytes:
+                _, evicted = self.frames.popitem(last=False)
+                self.bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                    'entries': len(self.frames), 'bytes': self.bytes, 'max_bytes': self.max_bytes, 'evictions': self.evictions}
+
+    def report(self):
+        stats = self.stats()
+        return (f"frame cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate'] * 100:.1f}% hit rate), "
+                f"{stats['entries']} frames in {stats['bytes'] / 1e6:.1f} / {stats['max_bytes'] / 1e6:.1f} MB, {stats['evictions']} evicted")
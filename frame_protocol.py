@@ -0,0 +1,189 @@
+import struct
+import zlib
+
+import numpy as np
+
+# Framing for the frames server.py streams to gui.py. Every frame is a fixed
+# header followed by the encoded payload:
+#   magic 'RTFR', frame id, width, height, encoding, flags, payload size
+# so the receiver knows exactly how many bytes to read and how to rebuild them.
+
+FRAME_MAGIC = b'RTFR'
+FRAME_HEADER = struct.Struct('<4sIHHBBHI')
+
+ENCODING_RAW = 0    # 512x512x3 bytes as read from the VDMA
+ENCODING_RLE = 1    # runs of identical pixels: run count, uint32 run lengths, RGB per run
+ENCODING_ZLIB = 2   # zlib level 1 of the raw frame
+ENCODING_DELTA = 3  # zlib of the XOR against the previous frame sent on this connection
+
+ENCODINGS = {
+    'raw': ENCODING_RAW,
+    'rle': ENCODING_RLE,
+    'zlib': ENCODING_ZLIB,
+    'delta': ENCODING_DELTA,
+}
+
+# Camera packet gui.py sends, one word per pixel generator register gp0..gp6.
+# Vectors are pairs of 12-bit signed values:
+#   gp0 dir z, y   gp1 dir x, pos z   gp2 pos y, x
+#   gp3 right z, y   gp4 right x, up z   gp5 up y, x
+#   gp6 background B, G, R
+# The top byte of gp6 is not a colour: a preview level there asks the software
+# source for a frame with 1 / 4**level of the pixels (1/4 or 1/16) while the
+# camera moves, the FPGA source always renders the full frame.
+CAMERA_PACKET = struct.Struct('<7I')
+BACKGROUND_REGISTER = 6
+PREVIEW_SHIFT = 24
+PREVIEW_LEVELS = (0, 1, 2)
+
+
+def to_12bit(value):
+    value = int(value)
+    if value < -2048 or value > 2047:
+        raise ValueError("Value out of range for 12-bit signed integer")
+    return value & 0xFFF
+
+
+def from_12bit(value):
+    value &= 0xFFF
+    return value - (1 << 12) if value & 0x800 else value
+
+
+def encode_camera_packet(camera, background=(0, 0, 0), preview=0):
+    # camera uses the keys of the camera_settings presets in gui.py
+    pos, front, right, up = (camera[key] for key in ("camera_pos", "camera_front", "right_vector", "up_vector"))
+    pairs = [(front[2], front[1]), (front[0], pos[2]), (pos[1], pos[0]),
+             (right[2], right[1]), (right[0], up[2]), (up[1], up[0])]
+    words = [to_12bit(high) << 12 | to_12bit(low) for high, low in pairs]
+    words.append(preview << PREVIEW_SHIFT | int(background[2]) << 16 | int(background[1]) << 8 | int(background[0]))
+    return CAMERA_PACKET.pack(*words)
+
+
+def decode_camera_packet(data):
+    # Returns the camera dict and the [R, G, B] background colour
+    words = CAMERA_PACKET.unpack(data[:CAMERA_PACKET.size])
+    values = []
+    for word in words[:6]:
+        values += [from_12bit(word >> 12), from_12bit(word)]
+    dir_z, dir_y, dir_x, pos_z, pos_y, pos_x, right_z, right_y, right_x, up_z, up_y, up_x = values
+    camera = {
+        "camera_pos": [pos_x, pos_y, pos_z],
+        "camera_front": [dir_x, dir_y, dir_z],
+        "right_vector": [right_x, right_y, right_z],
+        "up_vector": [up_x, up_y, up_z],
+    }
+    background = [words[6] & 0xFF, (words[6] >> 8) & 0xFF, (words[6] >> 16) & 0xFF]
+    return camera, background
+
+
+def packet_preview(data):
+    return CAMERA_PACKET.unpack(data[:CAMERA_PACKET.size])[BACKGROUND_REGISTER] >> PREVIEW_SHIFT
+
+
+def with_preview(data, preview):
+    # The same packet asking for another preview level (0 for the full frame)
+    words = list(CAMERA_PACKET.unpack(data[:CAMERA_PACKET.size]))
+    words[BACKGROUND_REGISTER] = preview << PREVIEW_SHIFT | words[BACKGROUND_REGISTER] & 0xFFFFFF
+    return CAMERA_PACKET.pack(*words)
+
+
+def changed_registers(previous, data):
+    # Indices of the gp registers that differ between two camera packets
+    return [register for register, (old, new) in enumerate(zip(CAMERA_PACKET.unpack(previous[:CAMERA_PACKET.size]), CAMERA_PACKET.unpack(data[:CAMERA_PACKET.size])))
+            if old != new]
+
+
+def rle_encode(frame):
+    pixels = frame.reshape(-1, 3)
+    packed = pixels[:, 0].astype(np.uint32) | pixels[:, 1].astype(np.uint32) << 8 | pixels[:, 2].astype(np.uint32) << 16
+    starts = np.flatnonzero(np.concatenate(([True], packed[1:] != packed[:-1])))
+    lengths = np.diff(np.append(starts, len(packed))).astype('<u4')
+    return struct.pack('<I', len(starts)) + lengths.tobytes() + pixels[starts].tobytes()
+
+
+def rle_decode(payload, out):
+    runs, = struct.unpack_from('<I', payload)
+    lengths = np.frombuffer(payload, dtype='<u4', count=runs, offset=4)
+    colours = np.frombuffer(payload, dtype=np.uint8, count=runs * 3, offset=4 + 4 * runs).reshape(-1, 3)
+    out.reshape(-1, 3)[:] = np.repeat(colours, lengths, axis=0)
+
+
+class FrameEncoder:
+    def __init__(self, encoding='raw'):
+        self.encoding = ENCODINGS[encoding] if isinstance(encoding, str) else encoding
+        self.previous = None
+
+    def encode(self, frame, frame_id, flags=0):
+        # Returns header and payload as one buffer, ready for sendall
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        height, width = frame.shape[:2]
+        encoding = self.encoding
+        if encoding == ENCODING_DELTA and (self.previous is None or self.previous.shape != frame.shape):
+            encoding = ENCODING_ZLIB  # key frame
+
+        if encoding == ENCODING_RAW:
+            payload = frame.tobytes()
+        elif encoding == ENCODING_RLE:
+            payload = rle_encode(frame)
+        elif encoding == ENCODING_ZLIB:
+            payload = zlib.compress(frame, 1)
+        else:
+            payload = zlib.compress(np.bitwise_xor(frame, self.previous), 1)
+
+        if self.encoding == ENCODING_DELTA:
+            self.previous = frame.copy()
+        return FRAME_HEADER.pack(FRAME_MAGIC, frame_id, width, height, encoding, flags, 0, len(payload)) + payload
+
+
+class FrameReceiver:
+    # Reads frames from a socket into buffers allocated once with recv_into,
+    # instead of growing a bytes object packet by packet
+
+    def __init__(self, sock, max_width=512, max_height=512):
+        self.sock = sock
+        self.header = bytearray(FRAME_HEADER.size)
+        self.payload = bytearray(max_width * max_height * 3 + 1024)
+        self.frame = np.zeros((max_height, max_width, 3), dtype=np.uint8)
+        self.frame_id = None
+        self.flags = 0
+
+    def _recv_exactly(self, buffer, size):
+        view = memoryview(buffer)[:size]
+        received = 0
+        while received < size:
+            count = self.sock.recv_into(view[received:], size - received)
+            if count == 0:
+                return False
+            received += count
+        return True
+
+    def receive(self):
+        # Returns the next decoded frame (a view that is reused for the next one), or None once the socket closes
+        if not self._recv_exactly(self.header, FRAME_HEADER.size):
+            return None
+        magic, frame_id, width, height, encoding, flags, _, size = FRAME_HEADER.unpack(self.header)
+        if magic != FRAME_MAGIC:
+            raise ValueError(f"Bad frame header {bytes(self.header)!r}")
+        if size > len(self.payload):
+            self.payload = bytearray(size)
+        if not self._recv_exactly(self.payload, size):
+            return None
+
+        if self.frame.shape[:2] != (height, width):
+            self.frame = np.zeros((height, width, 3), dtype=np.uint8)
+        payload = memoryview(self.payload)[:size]
+        flat = self.frame.reshape(-1)
+        if encoding == ENCODING_RAW:
+            flat[:] = np.frombuffer(payload, dtype=np.uint8)
+        elif encoding == ENCODING_RLE:
+            rle_decode(payload, self.frame)
+        elif encoding == ENCODING_ZLIB:
+            flat[:] = np.frombuffer(zlib.decompress(payload), dtype=np.uint8)
+        elif encoding == ENCODING_DELTA:
+            np.bitwise_xor(flat, np.frombuffer(zlib.decompress(payload), dtype=np.uint8), out=flat)
+        else:
+            raise ValueError(f"Unknown frame encoding {encoding}")
+
+        self.frame_id = frame_id
+        self.flags = flags
+        return self.frame
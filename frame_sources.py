@@ -0,0 +1,279 @@
+import hashlib
+import os
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+from frame_cache import FrameCache
+from frame_protocol import BACKGROUND_REGISTER, changed_registers, decode_camera_packet, packet_preview, with_preview
+
+# Where server.py gets its frames from. A source is started once per client
+# connection and turns each 28-byte camera packet into an (height, width, 3)
+# uint8 frame:
+#   PynqFrameSource      the ray tracer on the board, through the pixel generator registers and VDMA
+#   SoftwareFrameSource  the software ray tracer, so the server runs on any machine
+#   CachedFrameSource    pre-rendered frames stored by packet, falling back to another source
+#   MemoryCachedFrameSource  recently served frames kept in memory in front of another source
+# Sources with concurrent = True can serve several clients at once. scene_id
+# names everything besides the packet that decides what a frame looks like.
+
+
+def set_camera_params(pixgen, params):
+    # Unpack the data
+    regfile_0, regfile_1, regfile_2, regfile_3, regfile_4, regfile_5, regfile_6 = struct.unpack('IIIIIII', params[:28])
+
+    # Set the parameters in the registers
+    pixgen.register_map.gp0 = regfile_0
+    pixgen.register_map.gp1 = regfile_1
+    pixgen.register_map.gp2 = regfile_2
+    pixgen.register_map.gp3 = regfile_3
+    pixgen.register_map.gp4 = regfile_4
+    pixgen.register_map.gp5 = regfile_5
+    pixgen.register_map.gp6 = regfile_6
+
+    print("Received data:")
+    print(f"Camera Direction (hex): {regfile_0:08X}")
+    print(f"Camera Position (hex): {regfile_1:08X}")
+
+# Name of a pixel generator register that counts completed frames (e.g. 'gp7'),
+# if the bitstream has one. Without it frames are validated by content.
+FRAME_COUNTER_REGISTER = None
+# Seconds to wait for the counter before falling back to validation
+FRAME_COUNTER_TIMEOUT = 0.5
+# Upper bound on VDMA reads per request, the old fixed count
+MAX_FRAME_READS = 4
+
+def read_frame_for_params(pixgen, imgen_vdma, params_changed, last_frame=None):
+    # Return the first frame rendered entirely with the registers just written,
+    # and how many frames were read to get it. last_frame is a frame rendered
+    # before the write; without one every request takes MAX_FRAME_READS reads
+    if not params_changed:
+        return imgen_vdma.readframe(), 1
+
+    if FRAME_COUNTER_REGISTER is not None:
+        # The frame in flight when the registers changed may mix old and new
+        # parameters, so wait for the one after it to finish
+        start_count = int(getattr(pixgen.register_map, FRAME_COUNTER_REGISTER))
+        deadline = time.perf_counter() + FRAME_COUNTER_TIMEOUT
+        while time.perf_counter() < deadline:
+            if int(getattr(pixgen.register_map, FRAME_COUNTER_REGISTER)) - start_count >= 2:
+                return imgen_vdma.readframe(), 1
+            time.sleep(0.001)
+        print(f"{FRAME_COUNTER_REGISTER} did not count 2 frames in {FRAME_COUNTER_TIMEOUT} s, validating by content")
+
+    # Validation mode: the first read can be a stale buffered frame and the
+    # next one can be half old, half new. The scene is static, so once two
+    # reads in a row match and differ from a frame of the old parameters, the
+    # new ones have propagated. Views that look the same, or requests with no
+    # old frame to compare with, fall through to MAX_FRAME_READS, as before.
+    previous = imgen_vdma.readframe()
+    for reads in range(2, MAX_FRAME_READS + 1):
+        frame = imgen_vdma.readframe()
+        if last_frame is not None and np.array_equal(frame, previous) and not np.array_equal(frame, last_frame):
+            break
+        previous = frame
+    return frame, reads
+
+
+class PynqFrameSource:
+    concurrent = False  # one pixel generator and VDMA on the board
+
+    def __init__(self, bitstream="/home/xilinx/jupyter_notebooks/house.bit"):
+        # Imported here so the other sources work without pynq installed
+        from pynq import Overlay
+        from pynq.lib.video import common
+        self.video_mode = common.VideoMode(512, 512, 24)
+
+        # Load the overlay
+        self.overlay = Overlay(bitstream)
+        self.scene_id = os.path.abspath(bitstream)
+        print('Overlay loaded.')
+
+    def start(self):
+        # Initialize the pixel generator and VDMA
+        self.pixgen = self.overlay.pixel_generator_0
+        self.pixgen.register_map.gp0 = 0x0E600000
+        self.pixgen.register_map.gp1 = 0x000800FA
+        self.pixgen.register_map.gp2 = 0x00000001
+        self.pixgen.register_map.gp3 = 0x00000400
+        self.pixgen.register_map.gp4 = 0x00000000
+
+        self.imgen_vdma = self.overlay.video.axi_vdma_0.readchannel
+        self.imgen_vdma.mode = self.video_mode
+        self.imgen_vdma.start()
+        print('VDMA started.')
+        self.last_params = None
+        self.last_frame = None
+
+    def capture(self, data):
+        request_start = time.perf_counter()
+        # The board renders full frames only, drop the preview request
+        data = with_preview(data, 0)
+        if self.last_frame is None:
+            # Nothing served yet: read a frame of the registers start() wrote,
+            # so the first request can tell its own frames from stale ones
+            self.last_frame = self.imgen_vdma.readframe()
+
+        # Set the camera parameters in the register map
+        set_camera_params(self.pixgen, data)
+
+        print(self.pixgen.register_map)
+
+        frame, reads = read_frame_for_params(self.pixgen, self.imgen_vdma, data != self.last_params, self.last_frame)
+        self.last_params = data
+        self.last_frame = frame
+        print(f"frame ready after {reads} reads in {(time.perf_counter() - request_start) * 1000:.1f} ms")
+        return frame
+
+    def stop(self):
+        self.imgen_vdma.stop()
+        print("VDMA stopped.")
+
+
+class SoftwareFrameSource:
+    # Keeps the last frame and its hit mask for each client thread, so a packet
+    # that only changes the background colour (gp6) recolours the missed pixels
+    # instead of tracing every ray again. Packets with a preview level get a frame
+    # with 1 / 4**level of the pixels (RayTracer.renderPreview). With reproject
+    # full frames reuse the pixels of the client's last one that are still
+    # valid for the new camera (Reprojection.py) and trace only the rest. With
+    # workers > 1 one pool of render processes holding the scene is shared by
+    # all clients, from the first start() to the last stop()
+    concurrent = True
+
+    def __init__(self, scene, width=512, height=512, shading=False, workers=1, step_mode='hardware', reproject=False, max_error=1.0):
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'software'))
+        import RayTracer
+        import RayTracerParallel
+        from Octree import Octree
+        from Reprojection import Reprojector
+        self.Reprojector = Reprojector
+        self.TilePool = RayTracerParallel.TilePool
+        self.render = RayTracer.render
+        self.renderPreview = RayTracer.renderPreview
+        self.scene = Octree.load(scene)
+        self.width = width
+        self.height = height
+        self.workers = workers
+        self.options = {'shading': shading, 'step_mode': step_mode}
+        self.scene_id = f"{os.path.abspath(scene)}:{width}x{height}:{'shaded' if shading else 'flat'}:{step_mode}"
+        if reproject:
+            # Reprojected frames are approximate, keep them apart from exact renders
+            self.scene_id += f":reproject{max_error:g}"
+        self.reproject = reproject
+        self.max_error = max_error
+        self.last_render = threading.local()
+        self.pool = None
+        self.clients = 0
+        self.pool_lock = threading.Lock()
+
+    def start(self):
+        with self.pool_lock:
+            self.clients += 1
+            if self.workers > 1 and self.pool is None:
+                self.pool = self.TilePool(self.scene, self.workers)
+
+    def capture(self, data):
+        camera, background = decode_camera_packet(data)
+        preview = packet_preview(data)
+        last = self.last_render
+        if (getattr(last, 'packet', None) is not None and changed_registers(last.packet, data) == [BACKGROUND_REGISTER]
+                and packet_preview(last.packet) == preview):
+            frame = last.frame.copy()
+            frame[~last.hit] = background
+        else:
+            stats = {}
+            if preview:
+                frame = self.renderPreview(self.scene, camera, self.width, self.height, preview, background=background, stats=stats, pool=self.pool, **self.options)
+                last.hit = stats['hit']
+            elif self.reproject:
+                if getattr(last, 'reprojector', None) is None:
+                    last.reprojector = self.Reprojector(self.scene, self.width, self.height, self.options['shading'], self.options['step_mode'],
+                                                        max_error=self.max_error)
+                frame = last.reprojector.render(camera, background)
+                last.hit = last.reprojector.hitMask()
+                print(f"reprojected {last.reprojector.reused * 100:.1f}% of the frame")
+            else:
+                frame = self.render(self.scene, camera, self.width, self.height, background=background, stats=stats, pool=self.pool, **self.options)
+                last.hit = stats['hit']
+        last.packet = data
+        last.frame = frame
+        return frame
+
+    def stop(self):
+        with self.pool_lock:
+            self.clients -= 1
+            if self.clients == 0 and self.pool is not None:
+                self.pool.close()
+                self.pool = None
+
+
+class CachedFrameSource:
+    # Frames live in directory/<scene key>/<packet hex>.npy, where the scene key
+    # is a hash of the scene_id (written out to scene_id.txt next to them), so
+    # one directory can hold frames of several scenes, sizes and render modes
+    # without serving one for another. A packet without a frame is rendered by
+    # fallback (if given) and saved, so a first run through a camera path fills
+    # the cache and later runs never render. Without a fallback the scene_id
+    # of the frames to serve has to be given.
+
+    def __init__(self, directory, fallback=None, scene_id=None):
+        if fallback is None and scene_id is None:
+            raise ValueError("CachedFrameSource needs a fallback source or the scene_id of the cached frames")
+        self.fallback = fallback
+        self.concurrent = fallback is None or fallback.concurrent
+        self.scene_id = fallback.scene_id if fallback is not None else scene_id
+        self.directory = os.path.join(directory, hashlib.sha1(self.scene_id.encode()).hexdigest()[:16])
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'scene_id.txt'), 'w') as file:
+            file.write(self.scene_id + '\n')
+
+    def start(self):
+        if self.fallback is not None:
+            self.fallback.start()
+
+    def capture(self, data):
+        path = os.path.join(self.directory, data.hex() + '.npy')
+        if os.path.exists(path):
+            return np.load(path)
+        if self.fallback is None:
+            raise KeyError(f"No cached frame for packet {data.hex()}")
+        frame = np.asarray(self.fallback.capture(data))
+        # Write then rename, so a concurrent reader never sees half a frame
+        temp_path = f"{path}.{os.getpid()}.{id(frame)}.tmp"
+        with open(temp_path, 'wb') as file:
+            np.save(file, frame)
+        os.replace(temp_path, path)
+        return frame
+
+    def stop(self):
+        if self.fallback is not None:
+            self.fallback.stop()
+
+
+class MemoryCachedFrameSource:
+    # Answers packets seen before from a FrameCache without touching the
+    # source; the cache is shared by every client of the server
+
+    def __init__(self, source, max_bytes=64 * 1024 * 1024):
+        self.source = source
+        self.cache = FrameCache(max_bytes)
+        self.concurrent = source.concurrent
+        self.scene_id = source.scene_id
+
+    def start(self):
+        self.source.start()
+
+    def capture(self, data):
+        frame = self.cache.get(self.scene_id, data)
+        if frame is None:
+            frame = self.source.capture(data)
+            self.cache.put(self.scene_id, data, frame)
+        return frame
+
+    def stop(self):
+        print(self.cache.report())
+        self.source.stop()
@@ -5,6 +5,10 @@ import struct
 import threading
 from pygame.locals import *
 
+from camera_presets import camera_settings
+from frame_cache import FrameCache
+from frame_protocol import FrameReceiver
+
 # Initial camera parameters
 initial_camera_pos = np.array([450, 600, 300], dtype=np.int32)
 initial_camera_front = np.array([0, 0, 90], dtype=np.float32)
@@ -33,9 +37,28 @@ SERVER_PORT = 12345
 UPDATE_INTERVAL = 500  # 500 milliseconds
 last_update_time = 0
 
+# While the camera moves (right mouse drag or WASD) ask for previews with
+# 1/16 of the pixels (level 2 in the top byte of gp6, see frame_protocol.py)
+# this often, then for the full frame once it stops
+PREVIEW_LEVEL = 2
+PREVIEW_INTERVAL = 100
+camera_moving = False
+preview_shown = False
+
 # Shared variable for frame data
 frame_surface = None
 
+# Frames already received, by camera packet, so going back to a view shows it
+# without asking the server
+frame_cache = FrameCache(64 * 1024 * 1024)
+scene_id = f"{SERVER_IP}:{SERVER_PORT}"
+# Packets sent and not answered yet, by request index (the frame id the server replies with)
+sent_packets = {}
+sent_count = 0
+# Frames for requests sent before a view was shown from the cache are out of date
+stale_before = 0
+send_lock = threading.Lock()
+
 # Flag to indicate if camera parameters have changed
 camera_params_changed = False
 
@@ -64,45 +87,7 @@ environments = {
 
 selected_environment = "Environment 1"  # Default selected environment
 
-# Define camera settings with preset parameters
-camera_settings = {
-    "Preset: Z +ve": {
-        "camera_pos": [250, 512, 0],
-        "camera_front": [0, 0, 100],
-        "right_vector": [1, 0, 0],
-        "up_vector": [0, 1, 0]
-    },
-    "Preset: Z -ve": {
-        "camera_pos": [250, 512, 760],
-        "camera_front": [0, 0, -100],
-        "right_vector": [-1, 0, 0],
-        "up_vector": [0, 1, 0]
-    },
-    "Preset: Y +ve": {
-        "camera_pos": [250, 512, 0],
-        "camera_front": [0, 1, 0],
-        "right_vector": [1, 0, 0],
-        "up_vector": [0, 0, -1]
-    },
-    "Preset: Y -ve": {
-        "camera_pos": [250, 512, 0],
-        "camera_front": [0, -100, 0],
-        "right_vector": [1, 0, 0],
-        "up_vector": [0, 0, 1]
-    },
-    "Preset: X +ve": {
-        "camera_pos": [250, 512, 0],
-        "camera_front": [100, 0, 0],
-        "right_vector": [0, 0, -1],
-        "up_vector": [0, 1, 0]
-    },
-    "Preset: X -ve": {
-        "camera_pos": [250, 512, 0],
-        "camera_front": [-100, 0, 0],
-        "right_vector": [0, 0, 1],
-        "up_vector": [0, 1, 0]
-    }
-}
+# Camera settings with preset parameters are in camera_presets.py
 
 selected_camera_setting = "Preset: Z +ve"  # Default selected camera setting
 
@@ -203,8 +188,8 @@ def camera_front_to_yaw_pitch(camera_front):
     pitch = np.degrees(np.arcsin(norm_front[1]))
     return yaw, pitch
 
-def send_camera_parameters(client_socket):
-    global camera_front
+def send_camera_parameters(client_socket, preview=0):
+    global camera_front, sent_count, stale_before
 
     # Ensure all parameters are strictly integers
     camera_front_int = camera_front.astype(np.int32)
@@ -222,7 +207,7 @@ def send_camera_parameters(client_socket):
     regfile_3 = '00000000' + to_12bit_binary(right_vector[2]) + to_12bit_binary(right_vector[1])
     regfile_4 = '00000000' + to_12bit_binary(right_vector[0]) + to_12bit_binary(up_vector[2])
     regfile_5 = '00000000' + to_12bit_binary(up_vector[1]) + to_12bit_binary(up_vector[0])
-    regfile_6 = '00000000' + '{:08b}'.format(frame_background_color[2]) + '{:08b}'.format(frame_background_color[1]) + '{:08b}'.format(frame_background_color[0])
+    regfile_6 = '{:08b}'.format(preview) + '{:08b}'.format(frame_background_color[2]) + '{:08b}'.format(frame_background_color[1]) + '{:08b}'.format(frame_background_color[0])
     # Convert the binary strings to integers
     regfile_0_int = int(regfile_0, 2)
     regfile_1_int = int(regfile_1, 2)
@@ -244,7 +229,16 @@ def send_camera_parameters(client_socket):
         regfile_5_int,
         regfile_6_int
     )
-    client_socket.sendall(data)
+    with send_lock:
+        frame = frame_cache.get(scene_id, data)
+        if frame is not None:
+            show_frame(frame)
+            stale_before = sent_count
+            print("Frame from cache")
+            return
+        sent_packets[sent_count] = data
+        sent_count += 1
+        client_socket.sendall(data)
 
     print("Sent data!")
 # Helper function to convert to 12-bit signed binary string
@@ -312,32 +306,48 @@ def handle_slider_click(mouse_pos):
         camera_front[:] = (camera_front_normalized * magnitude).astype(np.int32)
         camera_params_changed = True
 
+def show_frame(frame):
+    global frame_surface
+    surface = pygame.image.frombuffer(frame.tobytes(), (frame.shape[1], frame.shape[0]), 'RGB')
+    # Previews come at a fraction of the size, stretch them to the full 512 x 512
+    frame_surface = surface if surface.get_size() == (512, 512) else pygame.transform.scale(surface, (512, 512))
+
 # Thread function to handle receiving frames from the server
 def receive_frames(client_socket):
-    global frame_surface
-    frame_size = 512 * 512 * 3  # Width * Height * 3 (RGB)
+    receiver = FrameReceiver(client_socket, 512, 512)
 
     while True:
-        frame_data = b''
-        while len(frame_data) < frame_size:
-            packet = client_socket.recv(frame_size - len(frame_data))
-            if not packet:
-                return
-            frame_data += packet
-        frame = np.frombuffer(frame_data, dtype=np.uint8).reshape((512, 512, 3))
-        frame_surface = pygame.image.frombuffer(frame.tobytes(), (512, 512), 'RGB')
+        frame = receiver.receive()
+        if frame is None:
+            return
+        with send_lock:
+            # A pipelined server skips requests, forget those along with this one
+            packet = sent_packets.pop(receiver.frame_id, None)
+            for frame_id in [frame_id for frame_id in sent_packets if frame_id < receiver.frame_id]:
+                del sent_packets[frame_id]
+            if packet is not None:
+                frame_cache.put(scene_id, packet, frame)
+            if receiver.frame_id >= stale_before:
+                show_frame(frame)
 
 # Thread function to handle sending camera parameters at regular intervals
 def send_camera_parameters_periodically(client_socket):
-    global last_update_time, camera_params_changed, last_sent_camera_front
+    global last_update_time, camera_params_changed, last_sent_camera_front, preview_shown
     while True:
         current_time = pygame.time.get_ticks()
-        if camera_params_changed and current_time - last_update_time > UPDATE_INTERVAL:
-            send_camera_parameters(client_socket)
+        moving = camera_moving
+        if camera_params_changed and current_time - last_update_time > (PREVIEW_INTERVAL if moving else UPDATE_INTERVAL):
+            send_camera_parameters(client_socket, PREVIEW_LEVEL if moving else 0)
             last_update_time = current_time
             camera_params_changed = False
             last_sent_camera_front = np.copy(camera_front)
-        pygame.time.delay(UPDATE_INTERVAL)
+            preview_shown = moving
+        elif preview_shown and not moving:
+            # The camera stopped, replace the preview with the full frame
+            send_camera_parameters(client_socket)
+            last_update_time = current_time
+            preview_shown = False
+        pygame.time.delay(PREVIEW_INTERVAL)
 
 # Process keyboard input for camera movement
 def process_keyboard_input(keys):
@@ -463,7 +473,7 @@ def handle_dropdown_click(mouse_pos, dropdown_rect, dropdown_type, screen, clien
 
 # Main loop
 def main():
-    global background_color, last_update_time, frame_surface, camera_params_changed, yaw, pitch, initial_yaw, initial_pitch
+    global background_color, frame_background_color, last_update_time, frame_surface, camera_params_changed, camera_moving, yaw, pitch, initial_yaw, initial_pitch
     screen = initialize()
     clock = pygame.time.Clock()
     running = True
@@ -545,6 +555,7 @@ def main():
                 if event.button == 3:  # Right mouse button
                     right_mouse_button_held = False
 
+        camera_moving = right_mouse_button_held or any(keys[key] for key in (K_w, K_a, K_s, K_d))
         if right_mouse_button_held:
             mouse_rel = pygame.mouse.get_rel()
             process_mouse(mouse_rel)
@@ -587,6 +598,7 @@ def main():
 
     pygame.quit()
     client_socket.close()
+    print(frame_cache.report())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
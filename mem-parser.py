@@ -1,70 +1,134 @@
-# Define the input and output file names
-input_file = '/Users/yanniszioulis/Documents/raytracinggithub/ray-tracing/mem-parser/octree_output.txt'
-intermediate_file = '/Users/yanniszioulis/Documents/raytracinggithub/ray-tracing/mem-parser/intermediate-octree_output.txt'
-final_output_file = '/Users/yanniszioulis/Documents/raytracinggithub/ray-tracing/mem-parser/effdog.mem'
-
-
-# Function to convert an integer to 32-bit hexadecimal in the required format
-def to_hex_32bit(value):
-    return f"{value:08x}"
-
-# Step 1: Add line numbers to the input file
-def add_line_numbers(input_file, output_file):
-    with open(input_file, 'r') as file:
-        lines = file.readlines()
-    
-    with open(output_file, 'w') as file:
-        for i, line in enumerate(lines):
-            file.write(f"{i}: {line}")
-
-# Step 2: Create a dictionary to map node numbers to their line indices
-def create_node_mapping(file_with_lines):
-    node_to_line_index = {}
-    with open(file_with_lines, 'r') as file:
-        lines = file.readlines()
-    
-    for i, line in enumerate(lines):
-        parts = line.split(':')
-        node_number = int(parts[1].split()[1])
-        node_to_line_index[node_number] = i
-    
-    return node_to_line_index, lines
-
-# Step 3: Update First Child Index and format lines
-def update_and_format_lines(node_to_line_index, lines, output_file):
-    with open(output_file, 'w') as file:
-        for index, line_content in enumerate(lines):
-            if "First Child Index" in line_content:
-                parts = line_content.split('First Child Index = ')
-                first_child_index = int(parts[1].strip())
-                if first_child_index in node_to_line_index:
-                    hex_index = to_hex_32bit(node_to_line_index[first_child_index])
-                    updated_line = f"{hex_index}\n"
-                else:
-                    updated_line = line_content
-            else:
-                if "Material ID = None" in line_content:
-                    updated_line = f"FFFFFFF0\n"
-                elif ("Material ID = BrownMaterial (Instance)" in line_content):
-                    updated_line = f"FFFFFFF1\n"
-                elif ("Material ID = BeigeMaterial (Instance)" in line_content):
-                    updated_line = f"FFFFFFF2\n"
-                elif ("Material ID = WhiteMaterial (Instance)" in line_content):
-                    updated_line = f"FFFFFFF3\n"
-                elif ("Material ID = BlackMaterial (Instance)" in line_content):
-                    updated_line = f"FFFFFFF4\n"
-                elif ("Material ID = DarkBeigeMaterial (Instance)" in line_content):
-                    updated_line = f"FFFFFFF5\n"
-            file.write(updated_line)
-
-# Main function to execute all steps
+import argparse
+import os
+import struct
+import sys
+import time
+from collections import deque
+
+# Converts the breadth first octree dump written by Octree.cs::BreadthFirstTraversal
+# in Unity, one line per node:
+#   Node 9: Material ID = None, MID1 = False, First Child Index = 17
+#   Node 17: Material ID = BrownMaterial (Instance), MID1 = False
+# into the .mem file OctantRom.sv loads: line i becomes word i, a node with
+# children becomes the address of its first child and a leaf becomes FFFFFFFx
+# with its material id in the low bits.
+#
+# The file is read in one pass. Every subdivided node has 8 children, so in
+# breadth first order the children of the k-th subdivided node start at line
+# 1 + 8k; the First Child Index from Unity is only checked against that when
+# its line comes up.
+
+LEAF_PREFIX = 0xFFFFFFF0
+
+# Unity material name -> material id (see COLOUR_FORMAT in RayProcessor.sv)
+default_materials = {
+    "None": 0,
+    "BrownMaterial (Instance)": 1,
+    "BeigeMaterial (Instance)": 2,
+    "WhiteMaterial (Instance)": 3,
+    "BlackMaterial (Instance)": 4,
+    "DarkBeigeMaterial (Instance)": 5,
+}
+
+# Words are written in batches of this many lines
+chunk_lines = 65536
+
+
+def convert(lines, materials=default_materials, hex_file=None, binary_file=None):
+    # Streams node lines to .mem words, returns the number of words written
+    leaves = {name: LEAF_PREFIX | material for name, material in materials.items()}
+    expected_nodes = deque()  # (address, node index Unity says is there), in address order
+    next_expected = -1
+    internal = 0
+    words = []
+    count = 0
+    for line_number, line in enumerate(lines, 1):
+        head, found, rest = line.partition(": Material ID = ")
+        if not found:
+            if line.isspace() or not line:
+                continue
+            raise ValueError(f"line {line_number}: not a node line: {line.strip()!r}")
+        material, _, tail = rest.partition(", MID1 = ")
+
+        if count == next_expected:
+            # Only the first child of each node is checked, so the node index is only parsed here
+            _, expected = expected_nodes.popleft()
+            if head != f"Node {expected}":
+                raise ValueError(f"line {line_number}: expected node {expected} at address {count}, found {head!r} "
+                                 "(the dump is not breadth first with 8 children per node)")
+            next_expected = expected_nodes[0][0] if expected_nodes else -1
+
+        _, subdivided, first_child = tail.partition(", First Child Index = ")
+        if subdivided:
+            address = 1 + 8 * internal
+            expected_nodes.append((address, int(first_child)))
+            if next_expected < 0:
+                next_expected = address
+            internal += 1
+            words.append(address)
+        elif material in leaves:
+            words.append(leaves[material])
+        else:
+            raise ValueError(f"line {line_number}: unknown material {material!r}, add it with --material")
+        count += 1
+
+        if len(words) == chunk_lines:
+            writeWords(words, count == len(words), hex_file, binary_file)
+            words = []
+    writeWords(words, count == len(words), hex_file, binary_file)
+
+    if expected_nodes:
+        raise ValueError(f"children of {len(expected_nodes)} nodes are missing from the end of the dump")
+    return count
+
+
+def writeWords(words, first, hex_file, binary_file):
+    if not words:
+        return
+    if hex_file is not None:
+        # Same format as the .mem files in rtl/: pointers in lower case, leaves in upper case
+        text = "\n".join([f"{word:08X}" if word >= LEAF_PREFIX else f"{word:08x}" for word in words])
+        hex_file.write(text if first else "\n" + text)
+    if binary_file is not None:
+        binary_file.write(struct.pack(f'<{len(words)}I', *words))
+
+
+def parseMaterials(options):
+    materials = dict(default_materials)
+    for option in options:
+        name, _, material = option.rpartition('=')
+        if not name or not material.isdigit() or int(material) > 7:
+            raise ValueError(f"--material expects NAME=ID with an id from 0 to 7, got {option!r}")
+        materials[name] = int(material)
+    return materials
+
+
 def main():
-    add_line_numbers(input_file, intermediate_file)
-    node_to_line_index, lines = create_node_mapping(intermediate_file)
-    update_and_format_lines(node_to_line_index, lines, final_output_file)
-    print(f"Processed {len(lines)} lines and saved to {final_output_file}")
+    parser = argparse.ArgumentParser(description="Convert a Unity octree dump to a .mem file for OctantRom.sv")
+    parser.add_argument('input', help="output of Octree.cs::BreadthFirstTraversal")
+    parser.add_argument('output', nargs='?', help=".mem hex file to write")
+    parser.add_argument('--binary', metavar='PATH', help="also write the words as packed little endian uint32")
+    parser.add_argument('--material', action='append', default=[], metavar='NAME=ID',
+                        help="map another Unity material to an id, e.g. 'RedMaterial (Instance)=6'")
+    args = parser.parse_args()
+    if args.output is None and args.binary is None:
+        parser.error("nothing to write, give an output and / or --binary")
 
-if __name__ == "__main__":
-    main()
+    start = time.perf_counter()
+    hex_file = open(args.output, 'w') if args.output else None
+    binary_file = open(args.binary, 'wb') if args.binary else None
+    try:
+        with open(args.input, 'r') as lines:
+            count = convert(lines, parseMaterials(args.material), hex_file, binary_file)
+    except ValueError as error:
+        sys.exit(f"{args.input}: {error}")
+    finally:
+        for file in (hex_file, binary_file):
+            if file is not None:
+                file.close()
+    elapsed = time.perf_counter() - start
+    print(f"Processed {count} nodes in {elapsed:.2f} s ({os.path.getsize(args.input) / elapsed / 1e6:.1f} MB/s)")
 
 
+if __name__ == "__main__":
+    main()
@@ -1,80 +1,205 @@
+import argparse
+import os
 import socket
-from pynq import Overlay
-from pynq.lib.video import *
-import struct
-
-def set_camera_params(pixgen, params):
-    # Unpack the data
-    regfile_0, regfile_1, regfile_2, regfile_3, regfile_4, regfile_5, regfile_6 = struct.unpack('IIIIIII', params[:28])
-
-    # Set the parameters in the registers
-    pixgen.register_map.gp0 = regfile_0
-    pixgen.register_map.gp1 = regfile_1
-    pixgen.register_map.gp2 = regfile_2
-    pixgen.register_map.gp3 = regfile_3
-    pixgen.register_map.gp4 = regfile_4
-    pixgen.register_map.gp5 = regfile_5
-    pixgen.register_map.gp6 = regfile_6
-
-    print("Received data:")
-    print(f"Camera Direction (hex): {regfile_0:08X}")
-    print(f"Camera Position (hex): {regfile_1:08X}")
-
-def start_server():
-    # Load the overlay
-    overlay = Overlay("/home/xilinx/jupyter_notebooks/house.bit")
-    print('Overlay loaded.')
+import threading
+import time
+import numpy as np
 
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_socket.bind(('0.0.0.0', 12345))  # Listen on all interfaces on port 12345
-    server_socket.listen(5)
-    print("Server listening on port 12345")
+from frame_protocol import ENCODINGS, FrameEncoder
+from frame_sources import CachedFrameSource, MemoryCachedFrameSource, PynqFrameSource, SoftwareFrameSource
+
+PACKET_SIZE = 28
+# Print latency stats after this many frames
+STATS_INTERVAL = 50
+
+def recv_packet(client_socket):
+    # recv(28) can return part of a packet, so keep reading until it is whole
+    data = b''
+    while len(data) < PACKET_SIZE:
+        chunk = client_socket.recv(PACKET_SIZE - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+class LatestSlot:
+    # Holds only the newest item put into it; older ones that were never taken
+    # are dropped and counted
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.item = None
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self.condition:
+            if self.item is not None:
+                self.dropped += 1
+            self.item = item
+            self.condition.notify()
+
+    def take(self):
+        # Blocks until there is an item, returns None once closed and empty
+        with self.condition:
+            while self.item is None and not self.closed:
+                self.condition.wait()
+            item, self.item = self.item, None
+            return item
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
 
+class LatencyStats:
+    def __init__(self):
+        self.samples = []
+
+    def record(self, seconds):
+        self.samples.append(seconds * 1000)
+
+    def report(self, dropped_packets, dropped_frames):
+        latency = np.array(self.samples)
+        print(f"{len(latency)} frames: latency mean {latency.mean():.1f} ms, p50 {np.percentile(latency, 50):.1f} ms, "
+              f"p95 {np.percentile(latency, 95):.1f} ms, max {latency.max():.1f} ms; "
+              f"dropped {dropped_packets} stale requests, {dropped_frames} stale frames")
+        self.samples = []
+
+def shutdown_socket(client_socket):
+    try:
+        client_socket.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+def serve_sequential(client_socket, capture_frame, encoder):
+    # One request at a time: every packet is rendered and answered in order
+    frame_id = 0
     while True:
-        client_socket, addr = server_socket.accept()
-        print(f"Connection from {addr}")
+        data = recv_packet(client_socket)
+        if data is None:
+            break
+        frame = capture_frame(data)
+        client_socket.sendall(encoder.encode(frame, frame_id))
+        frame_id += 1
+        print("frame completed")
+
+def serve_pipelined(client_socket, capture_frame, encoder):
+    # Three stages on their own threads: receiving packets, capturing frames
+    # and sending them. Each hand-off keeps only the newest item, so requests
+    # that arrive while a frame is in flight collapse into the latest one and
+    # frame N is sent while frame N + 1 is captured. The frame id is the index
+    # of the request the frame answers, so the client can tell which were skipped.
+    requests = LatestSlot()
+    frames = LatestSlot()
+    stats = LatencyStats()
 
+    def receive():
+        request_id = 0
         try:
-            # Initialize the pixel generator and VDMA
-            pixgen = overlay.pixel_generator_0
-            pixgen.register_map.gp0 = 0x0E600000
-            pixgen.register_map.gp1 = 0x000800FA
-            pixgen.register_map.gp2 = 0x00000001
-            pixgen.register_map.gp3 = 0x00000400
-            pixgen.register_map.gp4 = 0x00000000
-
-            imgen_vdma = overlay.video.axi_vdma_0.readchannel
-            videoMode = common.VideoMode(512, 512, 24)
-            imgen_vdma.mode = videoMode
-            imgen_vdma.start()
-            print('VDMA started.')
+            while True:
+                data = recv_packet(client_socket)
+                if data is None:
+                    break
+                requests.put((request_id, time.perf_counter(), data))
+                request_id += 1
+        except OSError:
+            pass
+        finally:
+            requests.close()
 
+    def send():
+        try:
             while True:
-                data = client_socket.recv(28)
-                if not data:
+                item = frames.take()
+                if item is None:
                     break
+                request_id, received_at, frame = item
+                client_socket.sendall(encoder.encode(frame, request_id))
+                stats.record(time.perf_counter() - received_at)
+                if len(stats.samples) >= STATS_INTERVAL:
+                    stats.report(requests.dropped, frames.dropped)
+        except OSError:
+            # Client went away, unblock the receiver
+            shutdown_socket(client_socket)
 
-                # Set the camera parameters in the register map
-                set_camera_params(pixgen, data)
-             
-                print(pixgen.register_map)
-                
-                # Read the frame 4 times
-                for _ in range(4):
-                    frame = imgen_vdma.readframe()
-                    print("reading frame for ", _ , " time")
-                frame_data = frame.tobytes()
-                print("frame completed")
-                # Send the frame data to the client
-                client_socket.sendall(frame_data)
-
-        except Exception as e:
-            print(f"An error occurred: {e}")
+    receiver = threading.Thread(target=receive, daemon=True)
+    sender = threading.Thread(target=send, daemon=True)
+    receiver.start()
+    sender.start()
+    try:
+        while True:
+            item = requests.take()
+            if item is None:
+                break
+            request_id, received_at, data = item
+            frames.put((request_id, received_at, capture_frame(data)))
+    finally:
+        frames.close()
+        sender.join()
+        shutdown_socket(client_socket)
+        receiver.join()
+    if stats.samples:
+        stats.report(requests.dropped, frames.dropped)
 
-        finally:
-            client_socket.close()
-            imgen_vdma.stop()
-            print("VDMA stopped.")
+def serve_client(client_socket, addr, source, encoding, pipelined):
+    print(f"Connection from {addr}")
+    try:
+        source.start()
+        encoder = FrameEncoder(encoding)
+        if pipelined:
+            serve_pipelined(client_socket, source.capture, encoder)
+        else:
+            serve_sequential(client_socket, source.capture, encoder)
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+    finally:
+        client_socket.close()
+        source.stop()
+
+def start_server(source=None, encoding='rle', pipelined=False, port=12345):
+    # source defaults to the FPGA (see frame_sources.py)
+    if source is None:
+        source = PynqFrameSource()
+
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind(('0.0.0.0', port))  # Listen on all interfaces
+    server_socket.listen(5)
+    print(f"Server listening on port {port}")
+
+    while True:
+        client_socket, addr = server_socket.accept()
+        if source.concurrent:
+            threading.Thread(target=serve_client, args=(client_socket, addr, source, encoding, pipelined), daemon=True).start()
+        else:
+            serve_client(client_socket, addr, source, encoding, pipelined)
 
 if __name__ == "__main__":
-    start_server()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Stream ray traced frames from the FPGA to gui.py")
+    parser.add_argument('--encoding', choices=ENCODINGS, default='rle', help="frame compression (see frame_protocol.py)")
+    parser.add_argument('--pipelined', action='store_true', help="coalesce camera updates to the newest one and overlap sending with capture")
+    parser.add_argument('--port', type=int, default=12345)
+    parser.add_argument('--source', choices=['pynq', 'software'], default='pynq', help="render on the FPGA or with the software ray tracer")
+    parser.add_argument('--bitstream', default="/home/xilinx/jupyter_notebooks/house.bit", help="overlay for the pynq source")
+    parser.add_argument('--scene', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rtl', 'house.mem'), help=".mem or scene file for the software source")
+    parser.add_argument('--size', type=int, default=512, help="frame width and height for the software source")
+    parser.add_argument('--workers', type=int, default=1, help="render processes for the software source")
+    parser.add_argument('--step-mode', choices=['hardware', 'dda'], default='dda', help="stepping for the software source")
+    parser.add_argument('--reproject', action='store_true', help="reuse pixels of the last frame after small camera moves (software source)")
+    parser.add_argument('--max-error', type=float, default=1.0, metavar='PX', help="sub-pixel error after which a reprojected pixel is traced again")
+    parser.add_argument('--cache', metavar='DIR', help="serve pre-rendered frames from DIR, rendering and storing the missing ones")
+    parser.add_argument('--memory-cache', type=float, default=64, metavar='MB', help="keep recently served frames in memory up to this size, 0 to turn off")
+    args = parser.parse_args()
+
+    if args.source == 'pynq':
+        source = PynqFrameSource(args.bitstream)
+    else:
+        source = SoftwareFrameSource(args.scene, args.size, args.size, workers=args.workers, step_mode=args.step_mode,
+                                     reproject=args.reproject, max_error=args.max_error)
+    if args.cache:
+        source = CachedFrameSource(args.cache, source)
+    if args.memory_cache > 0:
+        source = MemoryCachedFrameSource(source, int(args.memory_cache * 1024 * 1024))
+    start_server(source, args.encoding, args.pipelined, args.port)
\ No newline at end of file
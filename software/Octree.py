@@ -0,0 +1,188 @@
+import struct
+from functools import lru_cache
+
+import numpy as np
+
+# Flat octree in the same layout OctantRom.sv reads from the .mem files:
+# word 0 points at the root's 8 children, every other word is either a pointer
+# to the first of its node's 8 consecutive children or a leaf FFFFFFFx whose
+# low bits hold the material id (0 is empty space).
+
+LEAF_FLAG = 0x80000000
+LEAF_PREFIX = 0xFFFFFFF0
+MATERIAL_MASK = 0x7
+
+# Material colours from COLOUR_FORMAT in RayProcessor.sv
+HARDWARE_MATERIALS = [[0, 0, 0], [82, 45, 23], [192, 127, 52], [255, 255, 255], [0, 0, 0], [154, 104, 46], [0, 0, 255], [0, 0, 255]]
+
+# Binary scene file: a 64 byte header followed by the node words as little
+# endian uint32, so the words can be memory mapped straight from the file.
+#   magic 'OCTS', version, coord bit length, node count, root address (word 0),
+#   number of materials, 8 RGBx material colours, padding
+SCENE_MAGIC = b'OCTS'
+SCENE_VERSION = 1
+SCENE_HEADER = struct.Struct('<4sHHQII32s8x')
+
+
+def spreadBits(value):
+    # abc -> 00a00b00c, so x | y << 1 | z << 2 interleaves into a Morton code
+    spread = 0
+    bit = 0
+    while value >> bit:
+        spread |= ((value >> bit) & 1) << (3 * bit)
+        bit += 1
+    return spread
+
+
+@lru_cache(maxsize=None)
+def mortonTable(coord_bit_length):
+    return tuple(spreadBits(value) for value in range(1 << coord_bit_length))
+
+
+class Octree:
+    def __init__(self, nodes, coord_bit_length=10, materials=None):
+        self.nodes = np.ascontiguousarray(nodes, dtype=np.uint32)
+        self.coord_bit_length = coord_bit_length
+        self.materials = materials if materials is not None else HARDWARE_MATERIALS
+        self.morton = mortonTable(coord_bit_length)
+        # Set when the nodes are mapped from a scene file, so workers can map it too
+        self.path = None
+        self.dominant = None  # built by dominantMaterials
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @classmethod
+    def fromMem(cls, path, coord_bit_length=10, materials=None):
+        with open(path, 'r') as file:
+            words = file.read().split()
+        return cls(np.array([int(word, 16) for word in words], dtype=np.uint32), coord_bit_length, materials)
+
+    @classmethod
+    def fromScene(cls, path, materials=None):
+        # Maps the node words without reading them, pages are loaded as rays touch them
+        header = readSceneHeader(path)
+        nodes = np.memmap(path, dtype='<u4', mode='r', offset=SCENE_HEADER.size, shape=(header['node_count'],))
+        if int(nodes[0]) != header['root']:
+            raise ValueError(f"{path}: word 0 is {int(nodes[0]):08x}, the header says the root is at {header['root']:08x}")
+        octree = cls(nodes, header['coord_bit_length'], materials if materials is not None else header['materials'] or None)
+        octree.path = path
+        return octree
+
+    @classmethod
+    def load(cls, path, coord_bit_length=10, materials=None):
+        # Scene files carry their own bit length, .mem files use coord_bit_length
+        with open(path, 'rb') as file:
+            magic = file.read(len(SCENE_MAGIC))
+        if magic == SCENE_MAGIC:
+            return cls.fromScene(path, materials)
+        return cls.fromMem(path, coord_bit_length, materials)
+
+    @classmethod
+    def fromList(cls, octree, coord_bit_length=10, materials=None):
+        # Breadth first, so child blocks land in the same order mem-parser.py writes them
+        nodes = [1]
+        blocks = [octree]
+        block = 0
+        while block < len(blocks):
+            if len(blocks[block]) != 8:
+                raise ValueError(f"Octree node must have 8 children, got {len(blocks[block])}")
+            for child in blocks[block]:
+                if isinstance(child, list):
+                    nodes.append(1 + 8 * len(blocks))
+                    blocks.append(child)
+                elif 0 <= child <= MATERIAL_MASK:
+                    nodes.append(LEAF_PREFIX | child)
+                else:
+                    raise ValueError(f"Material id {child} does not fit in a leaf word")
+            block += 1
+        return cls(np.array(nodes, dtype=np.uint32), coord_bit_length, materials)
+
+    def descend(self, x, y, z):
+        # Walk from the root to the node containing (x, y, z); the 3 bits of the
+        # Morton code at each level are the octant {z, y, x} RayProcessor.sv uses
+        code = self.morton[x] | self.morton[y] << 1 | self.morton[z] << 2
+        shift = 3 * (self.coord_bit_length - 1)
+        nodes = self.nodes
+        node = int(nodes[0])
+        depth = 0
+        while not node & LEAF_FLAG and depth < self.coord_bit_length:
+            node = int(nodes[node + ((code >> shift) & 7)])
+            shift -= 3
+            depth += 1
+        return node, depth
+
+    def dominantMaterials(self, min_fill=0.0):
+        # Leaf word (LEAF_PREFIX | material) standing in for every child block,
+        # indexed like nodes by the value of the internal node pointing at it:
+        # the material filling most of the block's volume, or empty if no more
+        # than min_fill of the block is filled. Used by the level of detail
+        # cutoff in RayTracerBatch; built bottom up once and kept
+        if self.dominant is not None:
+            return self.dominant
+        nodes = self.nodes
+        levels = []
+        blocks = np.array([int(nodes[0])] if not nodes[0] & LEAF_FLAG else [], dtype=np.int64)
+        while blocks.size and len(levels) < self.coord_bit_length:
+            levels.append(blocks)
+            children = nodes[blocks[:, None] + np.arange(8)]
+            blocks = np.unique(children[children < LEAF_FLAG]).astype(np.int64)
+        every_block = np.unique(np.concatenate(levels)) if levels else np.zeros(0, dtype=np.int64)
+
+        # Share of each block's volume per material, deepest blocks first
+        fractions = np.zeros((len(every_block), MATERIAL_MASK + 1))
+        for blocks in reversed(levels):
+            children = nodes[blocks[:, None] + np.arange(8)]
+            shares = np.zeros((len(blocks), MATERIAL_MASK + 1))
+            rows, octants = np.nonzero(children >= LEAF_FLAG)
+            np.add.at(shares, (rows, children[rows, octants] & MATERIAL_MASK), 1)
+            rows, octants = np.nonzero(children < LEAF_FLAG)
+            np.add.at(shares, rows, fractions[np.searchsorted(every_block, children[rows, octants])])
+            fractions[np.searchsorted(every_block, blocks)] = shares / 8
+
+        filled = fractions[:, 1:].sum(axis=1) > min_fill
+        material = np.where(filled, fractions[:, 1:].argmax(axis=1) + 1, 0)
+        self.dominant = np.zeros(len(nodes), dtype=np.uint32)
+        self.dominant[every_block] = LEAF_PREFIX | material
+        return self.dominant
+
+    def toMem(self, path):
+        lines = [f"{word:08X}" if word & LEAF_FLAG else f"{word:08x}" for word in self.nodes.tolist()]
+        with open(path, 'w') as file:
+            file.write("\n".join(lines))
+
+    def toScene(self, path):
+        with open(path, 'wb') as file:
+            file.write(sceneHeader(len(self.nodes), int(self.nodes[0]), self.coord_bit_length, self.materials))
+            self.nodes.astype('<u4', copy=False).tofile(file)
+
+    def toList(self, address=None):
+        if address is None:
+            address = int(self.nodes[0])
+        children = []
+        for word in self.nodes[address:address + 8].tolist():
+            children.append(word & MATERIAL_MASK if word & LEAF_FLAG else self.toList(word))
+        return children
+
+
+def sceneHeader(node_count, root, coord_bit_length=10, materials=HARDWARE_MATERIALS):
+    if len(materials) > MATERIAL_MASK + 1:
+        raise ValueError(f"A scene holds at most {MATERIAL_MASK + 1} materials, got {len(materials)}")
+    colours = bytes(channel for colour in materials for channel in (*colour, 0))
+    return SCENE_HEADER.pack(SCENE_MAGIC, SCENE_VERSION, coord_bit_length, node_count, root, len(materials), colours)
+
+
+def readSceneHeader(path):
+    with open(path, 'rb') as file:
+        data = file.read(SCENE_HEADER.size)
+        file.seek(0, 2)
+        size = file.tell()
+    if len(data) < SCENE_HEADER.size or data[:len(SCENE_MAGIC)] != SCENE_MAGIC:
+        raise ValueError(f"{path}: not a scene file")
+    magic, version, coord_bit_length, node_count, root, material_count, colours = SCENE_HEADER.unpack(data)
+    if version != SCENE_VERSION:
+        raise ValueError(f"{path}: scene file version {version}, expected {SCENE_VERSION}")
+    if node_count == 0 or size != SCENE_HEADER.size + 4 * node_count:
+        raise ValueError(f"{path}: header says {node_count} nodes but the file holds {(size - SCENE_HEADER.size) / 4:g}")
+    materials = [list(colours[4 * i:4 * i + 3]) for i in range(material_count)]
+    return {'coord_bit_length': coord_bit_length, 'node_count': node_count, 'root': root, 'materials': materials}
@@ -0,0 +1,122 @@
+import argparse
+
+import numpy as np
+
+import RayTracerBatch
+from Octree import LEAF_FLAG, Octree
+
+# Optimisation pass between mem-parser.py and OctantRom.sv:
+#   deduplicate  identical subtrees are stored once and every parent points at
+#                the same 8 children (a sparse voxel DAG). Lookups return the
+#                same leaves, so renders are unchanged.
+#   collapse     a node whose 8 children are the same leaf becomes that leaf.
+#                Fewer levels to descend, but the ray steps through bigger
+#                leaves, so renders can change slightly.
+
+# Cameras the renders are compared from (pos, dir, up, right)
+check_cameras = {
+    "Z +ve": ([250, 512, 0], [0, 0, 100], [0, 1, 0], [1, 0, 0]),
+    "Z -ve": ([250, 512, 760], [0, 0, -100], [0, 1, 0], [-1, 0, 0]),
+    "X +ve": ([0, 512, 250], [100, 0, 0], [0, 1, 0], [0, 0, -1]),
+}
+
+
+def compact(octree, deduplicate=True, collapse=False):
+    nodes = octree.nodes.tolist()
+    blocks = {}     # 8 canonical children -> block id
+    canonical = {}  # address of a block in the input -> block id, or the leaf it collapsed to
+
+    def canonicalWord(word):
+        # Leaves stay as they are, pointers become block ids (always below LEAF_FLAG)
+        if word & LEAF_FLAG:
+            return word
+        if word in canonical:
+            return canonical[word]
+        children = tuple(canonicalWord(child) for child in nodes[word:word + 8])
+        if collapse and children[0] & LEAF_FLAG and children.count(children[0]) == 8:
+            result = children[0]
+        elif deduplicate:
+            result = blocks.setdefault(children, len(blocks))
+        else:
+            result = len(blocks)
+            blocks[(result,) + children] = result
+        canonical[word] = result
+        return result
+
+    root = canonicalWord(nodes[0])
+    block_children = [None] * len(blocks)
+    for key, block in blocks.items():
+        block_children[block] = key[-8:]
+
+    # Lay the blocks out breadth first from the root, as mem-parser.py does
+    if root & LEAF_FLAG:
+        return Octree([root], octree.coord_bit_length, octree.materials)
+    address = {root: 1}
+    order = [root]
+    for block in order:
+        for child in block_children[block]:
+            if not child & LEAF_FLAG and child not in address:
+                address[child] = 1 + 8 * len(order)
+                order.append(child)
+    words = [1]
+    for block in order:
+        words += [child if child & LEAF_FLAG else address[child] for child in block_children[block]]
+    return Octree(np.array(words, dtype=np.uint32), octree.coord_bit_length, octree.materials)
+
+
+def treeDepth(octree):
+    depth = 0
+    level = [int(octree.nodes[0])]
+    while level:
+        level = [child for node in level if not node & LEAF_FLAG for child in octree.nodes[node:node + 8].tolist()]
+        depth += 1
+    return depth - 1
+
+
+def sameVoxels(a, b, word_a=None, word_b=None):
+    # True if both octrees give every voxel the same material, however they are subdivided
+    if word_a is None:
+        word_a, word_b = int(a.nodes[0]), int(b.nodes[0])
+    if word_a & LEAF_FLAG and word_b & LEAF_FLAG:
+        return word_a == word_b
+    children_a = a.nodes[word_a:word_a + 8].tolist() if not word_a & LEAF_FLAG else [word_a] * 8
+    children_b = b.nodes[word_b:word_b + 8].tolist() if not word_b & LEAF_FLAG else [word_b] * 8
+    return all(sameVoxels(a, b, child_a, child_b) for child_a, child_b in zip(children_a, children_b))
+
+
+def compareRenders(before, after, size=256):
+    # Fraction of pixels that differ per camera, with and without shading
+    differences = {}
+    for name, (cam_pos, cam_norm, cam_up, cam_right) in check_cameras.items():
+        view = [np.array(vector) for vector in (cam_pos, cam_norm, cam_up, cam_right)]
+        for shading in (False, True):
+            images = [RayTracerBatch.renderFrame(octree, octree.materials, *view, size, size, shading=shading) for octree in (before, after)]
+            differences[(name, shading)] = np.any(images[0] != images[1], axis=2).mean()
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shrink a .mem octree by deduplicating and collapsing subtrees")
+    parser.add_argument('input', help=".mem or scene file")
+    parser.add_argument('output', help="compacted .mem file")
+    parser.add_argument('--collapse', action='store_true', help="also merge nodes whose 8 children are the same leaf (can change renders)")
+    parser.add_argument('--no-deduplicate', dest='deduplicate', action='store_false', help="keep identical subtrees separate")
+    parser.add_argument('--no-check', dest='check', action='store_false', help="skip rendering before and after")
+    args = parser.parse_args()
+
+    octree = Octree.load(args.input)
+    compacted = compact(octree, args.deduplicate, args.collapse)
+    compacted.toMem(args.output)
+
+    for label, tree in (("before", octree), ("after", compacted)):
+        print(f"{label:6s} {len(tree):8d} nodes  {tree.nodes.nbytes:9d} ROM bytes  depth {treeDepth(tree)}")
+    print(f"saved {(1 - len(compacted) / len(octree)) * 100:.1f}% of the ROM")
+    print("every voxel has the same material" if sameVoxels(octree, compacted) else "some voxels changed material")
+
+    if args.check:
+        for (name, shading), changed in compareRenders(octree, compacted).items():
+            print(f"{name:6s} {'shaded' if shading else 'flat':6s} {'identical' if changed == 0 else f'{changed * 100:.2f}% of pixels differ'}")
+
+
+if __name__ == "__main__":
+    main()
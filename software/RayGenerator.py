@@ -0,0 +1,64 @@
+from functools import lru_cache
+
+import numpy as np
+
+# Camera ray directions for a whole frame at once, as an (height, width, 3)
+# table cached by camera direction, right and up vectors and image size, so a
+# camera that only moves reuses it. hardware=True gives the directions
+# rtl/RayGenerator.sv computes, bit for bit:
+#   temp1 = loop_index % image_width - image_width / 2      (12-bit signed)
+#   temp2 = image_height / 2 - (loop_index >>> 8)           (12-bit signed)
+#   ray_dir = camera_right * temp1 + camera_up * temp2 + camera_dir, wrapped to 12 bits
+# loop_index counts from 1: the cores start at their core_number (1 and 2 in
+# RayTracingUnit.sv) and PixelBuffer.sv starts a frame at loop_index 1, so
+# output pixel (x, y) is generated with loop_index = y * width + x + 1. Every
+# ray is thus the one of the pixel to its right (temp1 = x + 1 - width / 2), the
+# last pixel of every row gets the column 0 ray of the next row, and >>> 8 is
+# the row only for 256-wide frames; wider frames (the 512 x 512 of the board
+# and testbench) step the row every 256 pixels. widthMismatch marks the pixels
+# whose ray is generated for another row than their own.
+
+DIRECTION_BITS = 12  # width of the camera inputs and ray_dir outputs of RayGenerator.sv
+ROW_SHIFT = 8  # loop_index >>> 8
+
+
+def wrapSigned(values, bits=DIRECTION_BITS):
+    # Two's complement wraparound of integers to a bits wide signed register
+    values = np.asarray(values, dtype=np.int64)
+    half = 1 << (bits - 1)
+    return ((values + half) & ((1 << bits) - 1)) - half
+
+
+def hardwareLoopIndex(im_width, im_height):
+    # loop_index RayGenerator.sv generates each output pixel with, (height, width)
+    return np.arange(im_height, dtype=np.int64)[:, None] * im_width + np.arange(im_width, dtype=np.int64) + 1
+
+
+def widthMismatch(im_width, im_height):
+    # Pixels whose hardware ray is generated for another row than their own:
+    # the last column of every row, and for widths other than 256 most of the rest
+    return hardwareLoopIndex(im_width, im_height) >> ROW_SHIFT != np.arange(im_height)[:, None]
+
+
+@lru_cache(maxsize=4)
+def cachedDirections(cam_norm, cam_up, cam_right, im_width, im_height, hardware):
+    if hardware:
+        cam_norm, cam_up, cam_right = (wrapSigned(np.round(vector)) for vector in (cam_norm, cam_up, cam_right))
+        loop_index = hardwareLoopIndex(im_width, im_height)
+        centered_x = wrapSigned(loop_index % im_width - im_width // 2)
+        centered_y = wrapSigned(im_height // 2 - (loop_index >> ROW_SHIFT))
+        directions = wrapSigned(centered_x[:, :, None] * cam_right + centered_y[:, :, None] * cam_up + cam_norm)
+    else:
+        cam_norm, cam_up, cam_right = (np.array(vector) for vector in (cam_norm, cam_up, cam_right))
+        centered_x = np.arange(im_width) - (im_width / 2)
+        centered_y = (im_height / 2) - np.arange(im_height)
+        directions = np.multiply.outer(centered_x, cam_right)[None, :, :] + np.multiply.outer(centered_y, cam_up)[:, None, :] + cam_norm
+    directions.setflags(write=False)
+    return directions
+
+
+def rayDirections(cam_norm, cam_up, cam_right, im_width, im_height, hardware=False):
+    # The shared table (read only); the same as RayTracer.py's per-pixel
+    # cam_right * centered_x + cam_up * centered_y + cam_norm unless hardware
+    key = tuple(tuple(np.asarray(vector).tolist()) for vector in (cam_norm, cam_up, cam_right))
+    return cachedDirections(*key, int(im_width), int(im_height), bool(hardware))
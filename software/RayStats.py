@@ -0,0 +1,69 @@
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+# Per-pixel traversal costs from a render with stats (RayTracer.render(...,
+# stats={})), saved as NumPy arrays, heatmap PNGs and histograms to find the
+# rays that bound the FPGA frame time:
+#   lookups    traverseTree calls
+#   levels     octree nodes descended through over all lookups
+#   max_depth  deepest single lookup
+#   steps      stepRay iterations (halvings)
+#   doublings  stepRay direction doublings
+#   hit        whether the ray hit a voxel
+# and with packet traversal (RayTracer.render(..., packet_size=8)):
+#   packet_lookups  traverseTree calls actually made, shared ones on the first ray of each packet
+#   packet_levels   octree nodes actually read
+
+# Black - purple - orange - yellow, roughly matplotlib's inferno
+heatmap_stops = np.array([[0, 0, 4], [87, 16, 110], [188, 55, 84], [249, 142, 9], [252, 255, 164]], dtype=np.float64)
+
+
+def heatmap(values):
+    # Scales values from 0 to their maximum onto the colour stops
+    values = np.asarray(values, dtype=np.float64)
+    scaled = values / values.max() if values.max() > 0 else values
+    position = scaled * (len(heatmap_stops) - 1)
+    lower = np.minimum(position.astype(np.int64), len(heatmap_stops) - 2)
+    fraction = (position - lower)[..., None]
+    colours = heatmap_stops[lower] * (1 - fraction) + heatmap_stops[lower + 1] * fraction
+    return np.round(colours).astype(np.uint8)
+
+
+def histograms(stats):
+    return {name: np.bincount(values.astype(np.int64).ravel()).tolist() for name, values in stats.items()}
+
+
+def saveStats(stats, directory):
+    # <name>.npy and <name>.png for every counter, histograms.json with the
+    # number of pixels for each count
+    os.makedirs(directory, exist_ok=True)
+    for name, values in stats.items():
+        np.save(os.path.join(directory, name + '.npy'), values)
+        Image.fromarray(heatmap(values), 'RGB').save(os.path.join(directory, name + '.png'))
+    with open(os.path.join(directory, 'histograms.json'), 'w') as file:
+        json.dump(histograms(stats), file)
+
+
+def worstRays(stats, count=5):
+    # Pixels with the most step iterations, then the most lookups
+    cost = stats['steps'] * (stats['lookups'].max() + 1) + stats['lookups']
+    order = np.argsort(cost, axis=None)[::-1][:count]
+    return [tuple(int(i) for i in np.unravel_index(index, cost.shape)) for index in order]
+
+
+def printSummary(stats):
+    for name, values in stats.items():
+        if name == 'hit':
+            print(f"{name:10s} {values.mean() * 100:.1f}% of rays")
+            continue
+        print(f"{name:10s} mean {values.mean():7.2f}  p50 {np.percentile(values, 50):5.0f}  p99 {np.percentile(values, 99):5.0f}  max {values.max():5d}")
+    if 'packet_lookups' in stats:
+        for name, total in (('lookups', 'packet_lookups'), ('levels', 'packet_levels')):
+            before, after = int(stats[name].sum()), int(stats[total].sum())
+            print(f"packets: {after} of {before} {name} per frame ({(1 - after / before) * 100:.1f}% fewer)")
+    for y, x in worstRays(stats):
+        counts = ", ".join(f"{name} {int(values[y, x])}" for name, values in stats.items())
+        print(f"  worst ray at x={x} y={y}: {counts}")
@@ -1,6 +1,13 @@
+import argparse
+
 import numpy as np
 from PIL import Image
 
+import RayGenerator
+import RayStats
+import RayTracerParallel
+from Octree import Octree, MATERIAL_MASK
+
 coord_bit_length = 10 
 
 cam_pos = np.array([200, 300, 0]) 
@@ -11,9 +18,20 @@ cam_right = np.array([1, 0, 0])
 im_height = 256
 im_width = 256
 
+reference = False # trace pixel by pixel instead of the whole frame at once (RayTracerBatch)
+
 
-octree = [0, 0, 0, 0, 0, 2, 3, 1] 
 material_table = [[0, 0, 0], [255, 255, 255], [0, 255, 0], [0,0,255], [255,0,0]]  # 0 black, 1  white, 2 green, 3 blue, 4 red
+octree = Octree.fromList([0, 0, 0, 0, 0, 2, 3, 1], coord_bit_length, material_table)
+#octree = Octree.fromMem('../rtl/house.mem', coord_bit_length)
+
+# Same keys as the camera_settings presets in gui.py
+camera = {
+    "camera_pos": cam_pos,
+    "camera_front": cam_norm,
+    "right_vector": cam_right,
+    "up_vector": cam_up
+}
 
 
 image = np.zeros((im_height, im_width, 3), dtype=np.uint8) 
@@ -21,29 +39,18 @@ image = np.zeros((im_height, im_width, 3), dtype=np.uint8)
 def roundPosition(position):
     return np.round(position).astype(int)
 
-def toBinaryStr(value, bit_length):
-    return format(value, f'0{bit_length}b')
-
 def withinAABB(position, aabb_min, aabb_max):
     return np.all(position >= aabb_min) and np.all(position <= aabb_max)
 
 def justOutsideAABB(position, aabb_min, aabb_max):
     return np.any(position == aabb_min - 1) or np.any(position == aabb_max + 1)
 
-def traverseTree(ray_pos, node, oct_size, aabb_min, aabb_max):
-    depth = 0
-    x_bin = toBinaryStr(ray_pos[0], coord_bit_length)
-    y_bin = toBinaryStr(ray_pos[1], coord_bit_length)
-    z_bin = toBinaryStr(ray_pos[2], coord_bit_length)
-    while isinstance(node, list) and depth < coord_bit_length:
-        octant = int(z_bin[depth] + y_bin[depth] + x_bin[depth], 2)
-        depth += 1
-        oct_size /= 2
-
-        aabb_min = aabb_min + (oct_size * np.array([int(x_bin[depth - 1]), int(y_bin[depth - 1]), int(z_bin[depth - 1])])).astype(int)
-        aabb_max = aabb_min + np.array([oct_size - 1, oct_size - 1, oct_size - 1]).astype(int)
-        node = node[octant]
-    return node, oct_size, aabb_min, aabb_max
+def traverseTree(ray_pos, octree, oct_size, aabb_min, aabb_max):
+    node, depth = octree.descend(int(ray_pos[0]), int(ray_pos[1]), int(ray_pos[2]))
+    oct_size = int(oct_size) >> depth
+    aabb_min = aabb_min + ((ray_pos - aabb_min) & -oct_size)
+    aabb_max = aabb_min + (oct_size - 1)
+    return node & MATERIAL_MASK, oct_size, aabb_min, aabb_max
 
 def stepRay(ray_pos, ray_dir, oct_size, aabb_min, aabb_max):
     while np.linalg.norm(ray_dir) < oct_size:
@@ -56,43 +63,121 @@ def stepRay(ray_pos, ray_dir, oct_size, aabb_min, aabb_max):
         ray_dir /= 2
     return ray_pos
 
-for y in range(im_height):
-    for x in range(im_width):
-        #print(x, y)
-        centered_x = x - (im_width / 2)
-        centered_y = (im_height / 2) - y
-        ray_dir = (cam_right * centered_x + cam_up * centered_y + cam_norm)
-        #ray_dir = ray_dir / np.linalg.norm(ray_dir)
+def traceRay(ray_pos, ray_dir, root):
+    world_size = 2**coord_bit_length
+    world_min = np.array([0, 0, 0], dtype=int)
+    world_max = np.array([world_size - 1, world_size - 1, world_size - 1], dtype=int)
+    aabb_min = world_min
+    aabb_max = world_max
 
-        ray_pos = np.copy(cam_pos)
-        
-        ray_pos = roundPosition(ray_pos)
+    while withinAABB(ray_pos, world_min, world_max):
         
-        world_size = 2**coord_bit_length
-        world_min = np.array([0, 0, 0], dtype=int)
-        world_max = np.array([world_size - 1, world_size - 1, world_size - 1], dtype=int)
-        aabb_min = world_min
-        aabb_max = world_max
+        mid, oct_size, aabb_min, aabb_max = traverseTree(ray_pos, root, world_size, world_min, world_max)
 
-        root = octree
+        if mid == 0:
+            ray_pos = stepRay(ray_pos, ray_dir, oct_size, aabb_min, aabb_max)
 
-        while withinAABB(ray_pos, world_min, world_max):
-            
-            mid, oct_size, aabb_min, aabb_max = traverseTree(ray_pos, root, world_size, world_min, world_max)
-
-            if mid == 0:
-                ray_pos = stepRay(ray_pos, ray_dir, oct_size, aabb_min, aabb_max)
+        if mid > 0:
+            return material_table[mid]
 
-            if mid > 0:
-                print("Colour found at pixel:", x, y, "Node:", mid)
-                colour = material_table[mid]
-                break
-        else:
-            colour = [0, 0, 0]  # Ray outside world, return black 
+    return [0, 0, 0]  # Ray outside world, return black 
 
-        image[y, x] = colour
+def renderReference():
+    for y in range(im_height):
+        for x in range(im_width):
+            #print(x, y)
+            centered_x = x - (im_width / 2)
+            centered_y = (im_height / 2) - y
+            ray_dir = (cam_right * centered_x + cam_up * centered_y + cam_norm)
+            #ray_dir = ray_dir / np.linalg.norm(ray_dir)
 
-print("done")
-img = Image.fromarray(image, 'RGB')
-img.save('ray_traced_image.png')
-img.show()
\ No newline at end of file
+            ray_pos = np.copy(cam_pos)
+            
+            ray_pos = roundPosition(ray_pos)
+
+            image[y, x] = traceRay(ray_pos, ray_dir, octree)
+
+def render(scene, camera, width, height, shading=False, workers=1, step_mode='hardware', background=None, stats=None, packet_size=None, hardware_rays=False, lod=None, pool=None):
+    # Render an Octree from a camera dict (camera_pos, camera_front, right_vector, up_vector), returns an (height, width, 3) uint8 image
+    # with missed rays set to the RGB background colour. A stats dict gets per-pixel traversal counts (see RayStats.py).
+    # packet_size traces blocks of packet_size x packet_size pixels as packets that share lookups, with the same image.
+    # hardware_rays generates the ray directions like RayGenerator.sv (12-bit, rows of 256 pixels, see RayGenerator.py).
+    # lod stops descent at octree nodes smaller than lod pixels, which count as their dominant material (Octree.dominantMaterials).
+    # pool is an open RayTracerParallel.TilePool of the scene to render on instead of starting workers for this frame
+    cam_pos, cam_norm, cam_right, cam_up = (np.asarray(camera[key]) for key in ("camera_pos", "camera_front", "right_vector", "up_vector"))
+    if hardware_rays and RayGenerator.widthMismatch(width, height).any():
+        print(f"note: RayGenerator.sv generates pixel (x, y) with loop_index y * width + x + 1 and takes rows as loop_index >> {RayGenerator.ROW_SHIFT}, "
+              f"so at {width}x{height} {RayGenerator.widthMismatch(width, height).mean() * 100:.1f}% of the rays are generated for another row")
+    return RayTracerParallel.renderTiled(scene, scene.materials, cam_pos, cam_norm, cam_up, cam_right, width, height, shading=shading, workers=workers, step_mode=step_mode, background=background, stats=stats, packet_size=packet_size, hardware_rays=hardware_rays, lod=lod, pool=pool)
+
+def previewCamera(camera, level):
+    # Right and up scaled by 2**level, so pixel (x, y) of the smaller frame is
+    # traced along the ray of pixel (x << level, y << level) of the full one
+    scale = 1 << level
+    return dict(camera, right_vector=[value * scale for value in camera["right_vector"]], up_vector=[value * scale for value in camera["up_vector"]])
+
+def renderPreview(scene, camera, width, height, level, **options):
+    # Every (1 << level)-th pixel of each row and column of the full frame
+    # (1/4 or 1/16 of the rays), exact when width and height are multiples of 1 << level
+    return render(scene, previewCamera(camera, level), width >> level, height >> level, **options)
+
+def upscale(frame, width, height):
+    # Nearest neighbour, for showing a preview at full size
+    scale_y, scale_x = -(-height // frame.shape[0]), -(-width // frame.shape[1])
+    return np.repeat(np.repeat(frame, scale_y, axis=0), scale_x, axis=1)[:height, :width]
+
+def parseArguments(description, camera, shading, reference=False):
+    # reference: the per-pixel loop renders the built-in scene and camera, so
+    # only --output and --no-show may be given
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('scene', nargs='?', help=".mem or scene file to render instead of the built-in octree")
+    parser.add_argument('--pos', type=int, nargs=3, default=list(camera["camera_pos"]), metavar=('X', 'Y', 'Z'), help="camera position")
+    parser.add_argument('--dir', type=int, nargs=3, default=list(camera["camera_front"]), metavar=('X', 'Y', 'Z'), help="camera direction, its length sets the field of view")
+    parser.add_argument('--right', type=int, nargs=3, default=list(camera["right_vector"]), metavar=('X', 'Y', 'Z'), help="camera right vector")
+    parser.add_argument('--up', type=int, nargs=3, default=list(camera["up_vector"]), metavar=('X', 'Y', 'Z'), help="camera up vector")
+    parser.add_argument('--width', type=int, default=im_width)
+    parser.add_argument('--height', type=int, default=im_height)
+    parser.add_argument('--shading', action=argparse.BooleanOptionalAction, default=shading)
+    parser.add_argument('--workers', type=int, default=1, help="number of processes rendering image tiles")
+    parser.add_argument('--step-mode', choices=['hardware', 'dda'], default='hardware', help="hardware: bit-exact doubling / halving steps, dda: jump straight to the exit of each empty octant")
+    parser.add_argument('--packet', type=int, metavar='N', help="trace N x N pixel packets that share octree lookups (same image, fewer traverseTree calls)")
+    parser.add_argument('--hardware-rays', action='store_true', help="generate ray directions in 12-bit arithmetic like RayGenerator.sv, including its 256-pixel rows")
+    parser.add_argument('--lod', type=float, metavar='PIXELS', help="stop descending at octree nodes smaller than PIXELS pixels and draw their dominant material")
+    parser.add_argument('--preview', type=int, choices=[1, 2], help="trace 1/4 (1) or 1/16 (2) of the pixels and upscale")
+    parser.add_argument('--output', default='ray_traced_image.png')
+    parser.add_argument('--stats', metavar='DIR', help="save per-pixel lookup / depth / step counts to DIR as .npy arrays, heatmaps and histograms")
+    parser.add_argument('--no-show', dest='show', action='store_false', help="only save the image")
+    args = parser.parse_args()
+    if reference:
+        ignored = [name for name, value in vars(args).items() if name not in ('output', 'show') and value != parser.get_default(name)]
+        if ignored:
+            parser.error(f"reference = True renders the built-in scene and camera, {', '.join(ignored)} cannot be used")
+    return args
+
+def main():
+    args = parseArguments("Software ray tracer without shading", camera, shading=False, reference=reference)
+
+    if reference:
+        renderReference()
+        frame = image
+    else:
+        scene = Octree.load(args.scene, coord_bit_length) if args.scene else octree
+        view = {"camera_pos": args.pos, "camera_front": args.dir, "right_vector": args.right, "up_vector": args.up}
+        stats = {} if args.stats else None
+        options = {'shading': args.shading, 'workers': args.workers, 'step_mode': args.step_mode, 'stats': stats, 'packet_size': args.packet, 'hardware_rays': args.hardware_rays, 'lod': args.lod}
+        if args.preview:
+            frame = upscale(renderPreview(scene, view, args.width, args.height, args.preview, **options), args.width, args.height)
+        else:
+            frame = render(scene, view, args.width, args.height, **options)
+        if stats is not None:
+            RayStats.printSummary(stats)
+            RayStats.saveStats(stats, args.stats)
+
+    print("done")
+    img = Image.fromarray(frame, 'RGB')
+    img.save(args.output)
+    if args.show:
+        img.show()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+import numpy as np
+
+import RayGenerator
+from Octree import LEAF_FLAG, MATERIAL_MASK
+
+# Whole-frame version of the per-pixel loop in RayTracer.py. Every ray of the
+# frame is held in (N, 3) arrays and traverseTree / stepRay are applied to all
+# still-active rays at once with masks, so the result is identical to tracing
+# each pixel on its own.
+
+
+def withinAABB(position, aabb_min, aabb_max):
+    return np.all((position >= aabb_min) & (position <= aabb_max), axis=1)
+
+
+def justOutsideAABB(position, aabb_min, aabb_max):
+    return np.any((position == aabb_min - 1) | (position == aabb_max + 1), axis=1)
+
+
+def rayNorm(ray_dir):
+    return np.sqrt(ray_dir[:, 0] * ray_dir[:, 0] + ray_dir[:, 1] * ray_dir[:, 1] + ray_dir[:, 2] * ray_dir[:, 2])
+
+
+def shorterThan(ray_dir, oct_size):
+    norm = rayNorm(ray_dir)
+    # np.linalg.norm on a single ray goes through BLAS dot, which may fuse the
+    # multiply-adds; redo the rare rays within rounding of oct_size that way
+    close = np.nonzero(np.abs(norm - oct_size) <= oct_size * 1e-12)[0]
+    for i in close:
+        norm[i] = np.linalg.norm(ray_dir[i])
+    return norm < oct_size
+
+
+def traverseTree(octree, ray_pos, max_depth=None):
+    # With max_depth (per ray) descent stops there and a node that is not a
+    # leaf yet counts as its dominant material (levelOfDetail)
+    node, oct_size, aabb_min, _ = descend(octree, ray_pos, *rootNodes(octree, len(ray_pos)), max_depth=max_depth)
+    if max_depth is not None:
+        node = cutOff(octree, node)
+    aabb_max = aabb_min + oct_size[:, None] - 1
+    return node & MATERIAL_MASK, oct_size, aabb_min, aabb_max
+
+
+def cutOff(octree, node):
+    # Internal nodes left where descent stopped become the leaf word of their block's dominant material
+    inner = node < LEAF_FLAG
+    if inner.any():
+        node = np.where(inner, octree.dominantMaterials()[np.where(inner, node, 0)], node)
+    return node
+
+
+def levelOfDetail(octree, ray_pos, origin, footprint):
+    # Depth at which each ray stops descending: the first one whose nodes are
+    # no bigger than footprint (voxels per unit of distance, the size of a
+    # pixel) times the ray's distance from its origin
+    distance = np.sqrt(np.sum((ray_pos - origin) ** 2, axis=1)) * footprint
+    coarse = np.floor(np.log2(np.maximum(distance, 1))).astype(np.int64)
+    return np.maximum(octree.coord_bit_length - coarse, 0)
+
+
+def rootNodes(octree, n):
+    # node, oct_size, aabb_min and depth of n rays at the root
+    return (np.full(n, octree.nodes[0], dtype=np.uint32), np.full(n, 1 << octree.coord_bit_length, dtype=np.int64),
+            np.zeros((n, 3), dtype=np.int64), np.zeros(n, dtype=np.int64))
+
+
+def descend(octree, ray_pos, node, oct_size, aabb_min, depth, max_depth=None):
+    # Walks every ray from its node down to the leaf containing it, or until it
+    # reaches its max_depth; the arrays are updated in place
+    nodes = octree.nodes
+    coord_bit_length = octree.coord_bit_length
+    limit = np.full(len(node), coord_bit_length) if max_depth is None else max_depth
+    inner = np.nonzero((node < LEAF_FLAG) & (depth < limit))[0]
+    while inner.size:
+        bits = (ray_pos[inner] >> (coord_bit_length - 1 - depth[inner])[:, None]) & 1
+        octant = bits[:, 0] | (bits[:, 1] << 1) | (bits[:, 2] << 2)
+        oct_size[inner] >>= 1
+        aabb_min[inner] += bits * oct_size[inner, None]
+        node[inner] = nodes[node[inner] + octant]
+        depth[inner] += 1
+        inner = inner[(node[inner] < LEAF_FLAG) & (depth[inner] < limit[inner])]
+    return node, oct_size, aabb_min, depth
+
+
+def traversePackets(octree, ray_pos, packets, max_depth=None):
+    # traverseTree for rays grouped into packets (packet ids non-decreasing).
+    # Each packet first descends once to the deepest node holding all its rays,
+    # found from the bits shared by the smallest and largest coordinates; if
+    # that node is a leaf every ray of the packet gets it without a lookup of
+    # its own, otherwise the rays carry on from it. Also returns, per ray, the
+    # traverseTree calls and node reads made for it, with those of the shared
+    # descent counted on the first ray of the packet. max_depth as traverseTree,
+    # the shared descent stops at the shallowest one of the packet
+    starts = np.concatenate(([0], np.nonzero(np.diff(packets))[0] + 1))
+    low = np.minimum.reduceat(ray_pos, starts, axis=0)
+    high = np.maximum.reduceat(ray_pos, starts, axis=0)
+    differing = np.bitwise_or.reduce(low ^ high, axis=1)
+    shared_depth = octree.coord_bit_length - np.where(differing > 0, np.floor(np.log2(np.maximum(differing, 1))).astype(np.int64) + 1, 0)
+    if max_depth is not None:
+        shared_depth = np.minimum(shared_depth, np.minimum.reduceat(max_depth, starts))
+    node, oct_size, aabb_min, depth = descend(octree, low, *rootNodes(octree, len(starts)), max_depth=shared_depth)
+
+    sizes = np.diff(np.append(starts, len(ray_pos)))
+    shared = node >= LEAF_FLAG
+    lookups = np.zeros(len(ray_pos), dtype=np.int64)
+    levels = np.zeros(len(ray_pos), dtype=np.int64)
+    lookups[starts] = shared
+    levels[starts] = depth
+
+    node, oct_size, aabb_min, start_depth = (np.repeat(array, sizes, axis=0) for array in (node, oct_size, aabb_min, depth))
+    own = np.nonzero(node < LEAF_FLAG)[0]
+    own_node, own_size, own_min, own_depth = descend(octree, ray_pos[own], node[own], oct_size[own], aabb_min[own], start_depth[own],
+                                                     max_depth=None if max_depth is None else max_depth[own])
+    node[own], oct_size[own], aabb_min[own] = own_node, own_size, own_min
+    lookups[own] += 1
+    levels[own] += own_depth - start_depth[own]
+    if max_depth is not None:
+        node = cutOff(octree, node)
+
+    aabb_max = aabb_min + oct_size[:, None] - 1
+    return node & MATERIAL_MASK, oct_size, aabb_min, aabb_max, lookups, levels
+
+
+def stepRay(ray_pos, ray_dir, oct_size, aabb_min, aabb_max):
+    # Returns the stepping iterations and direction doublings of every ray
+    doublings = np.zeros(len(ray_pos), dtype=np.int64)
+    grow = np.nonzero(shorterThan(ray_dir, oct_size))[0]
+    while grow.size:
+        ray_dir[grow] *= 2
+        doublings[grow] += 1
+        grow = grow[shorterThan(ray_dir[grow], oct_size[grow])]
+
+    iterations = np.zeros(len(ray_pos), dtype=np.int64)
+    stepping = np.nonzero(~justOutsideAABB(ray_pos, aabb_min, aabb_max))[0]
+    while stepping.size:
+        box_min = aabb_min[stepping]
+        box_max = aabb_max[stepping]
+        temp_position = np.round(ray_pos[stepping] + ray_dir[stepping]).astype(np.int64)
+        accept = withinAABB(temp_position, box_min, box_max) | justOutsideAABB(temp_position, box_min, box_max)
+        ray_pos[stepping[accept]] = temp_position[accept]
+        ray_dir[stepping] /= 2
+        iterations[stepping] += 1
+        stepping = stepping[~justOutsideAABB(ray_pos[stepping], box_min, box_max)]
+    return iterations, doublings
+
+
+def stepRayDDA(ray_pos, ray_dir, oct_size, aabb_min, aabb_max):
+    # Slab test against the faces of the leaf (half a unit past the outer voxels):
+    # the nearest face is where the ray leaves, so the ray moves straight to the
+    # first position just outside the leaf in one step
+    with np.errstate(divide='ignore', invalid='ignore'):
+        face = np.where(ray_dir > 0, aabb_max + 0.5, aabb_min - 0.5)
+        t = (face - ray_pos) / ray_dir
+    t[ray_dir == 0] = np.inf
+    axis = np.argmin(t, axis=1)
+    rows = np.arange(len(ray_pos))
+    t_exit = t[rows, axis][:, None]
+    moving = np.isfinite(t_exit[:, 0])
+
+    exit_position = np.round(ray_pos + np.where(moving[:, None], t_exit, 0) * ray_dir).astype(np.int64)
+    exit_position[rows, axis] = np.where(ray_dir[rows, axis] > 0, aabb_max[rows, axis] + 1, aabb_min[rows, axis] - 1)
+    ray_pos[moving] = exit_position[moving]
+    return moving.astype(np.int64), np.zeros(len(ray_pos), dtype=np.int64)
+
+
+step_functions = {
+    'hardware': stepRay,  # bit-exact with the per-pixel renderers and the doubling / halving of RayProcessor.sv
+    'dda': stepRayDDA,
+}
+
+
+def traceRays(octree, ray_pos, ray_dir, step_mode='hardware', stats=None, packets=None, lod=None):
+    # Returns the material id of every ray (0 for a miss) with the position and
+    # leaf bounds it stopped in. A stats dict gets per-ray counts of 'lookups'
+    # (traverseTree calls), 'levels' (nodes descended through over all lookups),
+    # 'max_depth' (deepest single lookup), 'steps' (stepping iterations) and
+    # 'doublings' (direction doublings). With packets (a non-decreasing packet
+    # id per ray) the lookups go through traversePackets, which gives the same
+    # results; the stats then also get the 'packet_lookups' and 'packet_levels'
+    # it actually made. lod (voxels per unit of distance) turns on the level of
+    # detail cutoff: lookups stop at nodes no bigger than lod times their
+    # distance from the ray's start, which then count as their dominant material
+    step = step_functions[step_mode]
+    ray_pos = np.round(ray_pos).astype(np.int64)
+    origin = ray_pos.copy()
+    ray_dir = np.array(ray_dir, dtype=np.float64)
+    material = np.zeros(len(ray_pos), dtype=np.int64)
+    hit_min = np.zeros_like(ray_pos)
+    hit_max = np.zeros_like(ray_pos)
+    lookups = np.zeros(len(ray_pos), dtype=np.int64)
+    levels = np.zeros(len(ray_pos), dtype=np.int64)
+    max_depth = np.zeros(len(ray_pos), dtype=np.int64)
+    steps = np.zeros(len(ray_pos), dtype=np.int64)
+    doublings = np.zeros(len(ray_pos), dtype=np.int64)
+    packet_lookups = np.zeros(len(ray_pos), dtype=np.int64)
+    packet_levels = np.zeros(len(ray_pos), dtype=np.int64)
+
+    world_max = (1 << octree.coord_bit_length) - 1
+    active = np.nonzero(withinAABB(ray_pos, 0, world_max))[0]
+    while active.size:
+        pos = ray_pos[active]
+        limit = None if lod is None else levelOfDetail(octree, pos, origin[active], lod)
+        if packets is None:
+            mid, oct_size, aabb_min, aabb_max = traverseTree(octree, pos, limit)
+        else:
+            mid, oct_size, aabb_min, aabb_max, made_lookups, made_levels = traversePackets(octree, pos, packets[active], limit)
+            packet_lookups[active] += made_lookups
+            packet_levels[active] += made_levels
+        lookups[active] += 1
+        depth = octree.coord_bit_length - np.log2(oct_size).astype(np.int64)
+        levels[active] += depth
+        max_depth[active] = np.maximum(max_depth[active], depth)
+
+        hit = mid > 0
+        material[active[hit]] = mid[hit]
+        hit_min[active[hit]] = aabb_min[hit]
+        hit_max[active[hit]] = aabb_max[hit]
+
+        empty = ~hit
+        active = active[empty]
+        pos = pos[empty]
+        dirs = ray_dir[active]
+        ray_steps, ray_doublings = step(pos, dirs, oct_size[empty], aabb_min[empty], aabb_max[empty])
+        steps[active] += ray_steps
+        doublings[active] += ray_doublings
+        ray_pos[active] = pos
+        ray_dir[active] = dirs
+
+        active = active[withinAABB(pos, 0, world_max)]
+
+    if stats is not None:
+        stats['lookups'] = lookups
+        stats['levels'] = levels
+        stats['max_depth'] = max_depth
+        stats['steps'] = steps
+        stats['doublings'] = doublings
+        if packets is not None:
+            stats['packet_lookups'] = packet_lookups
+            stats['packet_levels'] = packet_levels
+    return material, ray_pos, hit_min, hit_max
+
+
+def applyGammaCorrection(color, gamma=2.2):
+    return np.clip(255 * (color / 255) ** (1 / gamma), 0, 255).astype(np.uint8)
+
+
+# applyGammaCorrection of every uint8 channel value
+gamma_table = applyGammaCorrection(np.arange(256))
+
+# Face normals in the order shadeHits tests the faces: -x, +x, -y, +y, -z, +z
+face_normals = np.array([[-1, 0, 0], [1, 0, 0], [0, -1, 0], [0, 1, 0], [0, 0, -1], [0, 0, 1]])
+
+
+def shadeHits(material_table, cam_pos, material, hit_pos, hit_min, hit_max):
+    # Same lighting as RayTracerShading.py: squared cosine between the face the
+    # ray entered through and the direction back to the camera, then gamma.
+    # Deferred pass over the whole frame's hit position, leaf bounds and material
+    colours = np.zeros((len(material), 3), dtype=np.uint8)
+    hits = np.nonzero(material)[0]
+    ray_pos = hit_pos[hits]
+    faces = np.stack([ray_pos == hit_min[hits], ray_pos == hit_max[hits]], axis=2).reshape(-1, 6)
+    # The first face that matches, like the if chain; no face gives a zero normal
+    hit_normal = np.where(faces.any(axis=1)[:, None], face_normals[faces.argmax(axis=1)], 0)
+
+    # A ray that stops at the camera position has no light direction; its NaN
+    # brightness becomes black, as in the per-pixel version
+    with np.errstate(invalid='ignore', divide='ignore'):
+        light_dir = np.asarray(cam_pos) - ray_pos
+        light_dir = light_dir / np.sqrt(np.einsum('ij,ij->i', light_dir, light_dir))[:, None]
+        brightness_factor = np.einsum('ij,ij->i', light_dir, hit_normal) ** 2
+        colour = np.array(material_table)[material[hits]] * brightness_factor[:, None]
+        colour = np.clip(colour, 0, 255).astype(np.uint8)
+    colours[hits] = gamma_table[colour]
+    return colours
+
+
+def cameraRays(cam_pos, cam_norm, cam_up, cam_right, im_width, im_height, tile=None, hardware_rays=False):
+    # tile = (x0, y0, x1, y1) limits the rays to that part of the image.
+    # hardware_rays uses the 12-bit directions of RayGenerator.sv (RayGenerator.py)
+    x0, y0, x1, y1 = tile if tile is not None else (0, 0, im_width, im_height)
+    ray_dir = RayGenerator.rayDirections(cam_norm, cam_up, cam_right, im_width, im_height, hardware_rays)[y0:y1, x0:x1]
+    ray_pos = np.broadcast_to(np.asarray(cam_pos), ray_dir.shape)
+    return ray_pos.reshape(-1, 3), ray_dir.reshape(-1, 3)
+
+
+def renderFrame(octree, material_table, cam_pos, cam_norm, cam_up, cam_right, im_width, im_height, shading=False, tile=None, step_mode='hardware', stats=None, background=None, packet_size=None, hardware_rays=False, lod=None):
+    # background is the RGB colour of rays that miss the scene (black by default).
+    # A stats dict gets the traceRays counts and 'hit' as (height, width) arrays.
+    # packet_size traces the rays of each packet_size x packet_size block of
+    # pixels as a packet (see traversePackets). hardware_rays: see cameraRays.
+    # lod stops octree descent at nodes smaller than lod pixels (1 = one pixel
+    # at the middle of the image) and uses their dominant material
+    x0, y0, x1, y1 = tile if tile is not None else (0, 0, im_width, im_height)
+    if lod is not None:
+        lod = lod * max(np.linalg.norm(cam_right), np.linalg.norm(cam_up)) / np.linalg.norm(cam_norm)
+    ray_pos, ray_dir = cameraRays(cam_pos, cam_norm, cam_up, cam_right, im_width, im_height, tile, hardware_rays)
+    if shading:
+        ray_dir = ray_dir / np.linalg.norm(ray_dir, axis=1)[:, None]
+    if packet_size:
+        # Rays of a packet next to each other, undone after tracing
+        rows, columns = np.divmod(np.arange(len(ray_pos)), x1 - x0)
+        packets = rows // packet_size * -(-(x1 - x0) // packet_size) + columns // packet_size
+        order = np.argsort(packets, kind='stable')
+        material, hit_pos, hit_min, hit_max = traceRays(octree, ray_pos[order], ray_dir[order], step_mode, stats, packets[order], lod)
+        inverse = np.argsort(order)
+        material, hit_pos, hit_min, hit_max = material[inverse], hit_pos[inverse], hit_min[inverse], hit_max[inverse]
+        if stats is not None:
+            for name in stats:
+                stats[name] = stats[name][inverse]
+    else:
+        material, hit_pos, hit_min, hit_max = traceRays(octree, ray_pos, ray_dir, step_mode, stats, lod=lod)
+
+    if shading:
+        image = shadeHits(material_table, cam_pos, material, hit_pos, hit_min, hit_max)
+    else:
+        image = np.array(material_table, dtype=np.uint8)[material]
+    image[material == 0] = background if background is not None else 0  # Ray outside world
+
+    if stats is not None:
+        stats['hit'] = material > 0
+        for name in stats:
+            stats[name] = stats[name].reshape(y1 - y0, x1 - x0)
+    return image.reshape(y1 - y0, x1 - x0, 3)
@@ -0,0 +1,107 @@
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+import RayTracerBatch
+from Octree import Octree
+
+# Tiled rendering on a process pool. The octree words are copied once into a
+# shared memory block that every worker maps, so the scene is never pickled;
+# an octree mapped from a scene file is not copied, every worker maps the file
+# instead. Each worker renders whole tiles with RayTracerBatch and the parent
+# copies them into the image. A TilePool keeps the workers and the shared scene
+# for as many frames as it is open, so interactive callers (server.py) pay for
+# process startup and the scene copy once; renderTiled without one opens a pool
+# for that frame only.
+
+tile_size = 32
+
+# Per-worker state, set up by initWorker
+worker_scene = None
+
+
+def initWorker(shm_name, scene_path, node_count, coord_bit_length):
+    global worker_scene
+    if scene_path is not None:
+        worker_scene = (None, Octree.fromScene(scene_path))
+        return
+    shm = shared_memory.SharedMemory(name=shm_name)
+    nodes = np.ndarray((node_count,), dtype=np.uint32, buffer=shm.buf)
+    # Keep the mapping alive for as long as the worker runs
+    worker_scene = (shm, Octree(nodes, coord_bit_length))
+
+
+def renderTile(task):
+    # task is (tile, render_args, render_options, collect_stats)
+    tile, render_args, render_options, collect_stats = task
+    _, octree = worker_scene
+    stats = {} if collect_stats else None
+    return tile, RayTracerBatch.renderFrame(octree, *render_args, tile=tile, stats=stats, **render_options), stats
+
+
+def imageTiles(im_width, im_height, size=tile_size):
+    return [(x, y, min(x + size, im_width), min(y + size, im_height))
+            for y in range(0, im_height, size)
+            for x in range(0, im_width, size)]
+
+
+class TilePool:
+    # Worker processes holding one octree, open until close()
+
+    def __init__(self, octree, workers):
+        self.octree = octree
+        self.workers = workers
+        self.shm = None if octree.path is not None else shared_memory.SharedMemory(create=True, size=max(octree.nodes.nbytes, 1))
+        try:
+            if self.shm is not None:
+                np.ndarray(octree.nodes.shape, dtype=np.uint32, buffer=self.shm.buf)[:] = octree.nodes
+            init_args = (self.shm and self.shm.name, octree.path, len(octree.nodes), octree.coord_bit_length)
+            self.pool = Pool(workers, initializer=initWorker, initargs=init_args)
+        except BaseException:
+            self.releaseScene()
+            raise
+
+    def releaseScene(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+        self.releaseScene()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def renderTiled(octree, material_table, cam_pos, cam_norm, cam_up, cam_right, im_width, im_height, shading=False, workers=1, image=None, step_mode='hardware', background=None, stats=None, packet_size=None, hardware_rays=False, lod=None, pool=None):
+    # A stats dict gets the per-pixel RayTracerBatch counts as (height, width) arrays.
+    # pool is an open TilePool of this octree to render on, workers is then ignored
+    if image is None:
+        image = np.zeros((im_height, im_width, 3), dtype=np.uint8)
+    render_args = (material_table, cam_pos, cam_norm, cam_up, cam_right, im_width, im_height)
+    render_options = {'shading': shading, 'step_mode': step_mode, 'background': background, 'packet_size': packet_size, 'hardware_rays': hardware_rays, 'lod': lod}
+
+    if pool is None and workers <= 1:
+        image[:] = RayTracerBatch.renderFrame(octree, *render_args, stats=stats, **render_options)
+        return image
+
+    own_pool = pool is None
+    if own_pool:
+        pool = TilePool(octree, workers)
+    try:
+        tasks = [(tile, render_args, render_options, stats is not None) for tile in imageTiles(im_width, im_height)]
+        for (x0, y0, x1, y1), pixels, tile_stats in pool.pool.imap_unordered(renderTile, tasks):
+            image[y0:y1, x0:x1] = pixels
+            if stats is not None:
+                for name, values in tile_stats.items():
+                    stats.setdefault(name, np.zeros((im_height, im_width), dtype=values.dtype))[y0:y1, x0:x1] = values
+    finally:
+        if own_pool:
+            pool.close()
+    return image
@@ -2,6 +2,11 @@ import numpy as np
 from PIL import Image
 from tqdm import tqdm
 
+import RayStats
+import RayTracer
+from Octree import Octree, MATERIAL_MASK
+from RayTracerBatch import gamma_table
+
 # Parameters
 coord_bit_length = 10
 cam_pos = np.array([200, 300, 0])
@@ -10,9 +15,11 @@ cam_up = np.array([0, 1, 0])
 cam_right = np.array([1, 0, 0])
 im_height = 256
 im_width = 256
-#octree = [0, 0, 0, 0, [0,0,0,0,3,2,4,[0,3,0,0,1,[0,0,0,0,0,1,2,3],2,1]], 2, 3, 1]
-octree = [0, 0, 0, 0, 0, 2, 3, 1]
+reference = False  # trace pixel by pixel instead of tiles of whole rays at once (RayTracerParallel)
 material_table = [[0, 0, 0], [255, 255, 255], [0, 255, 0], [0, 0, 255], [255, 0, 0]]
+#octree = Octree.fromList([0, 0, 0, 0, [0,0,0,0,3,2,4,[0,3,0,0,1,[0,0,0,0,0,1,2,3],2,1]], 2, 3, 1], coord_bit_length, material_table)
+octree = Octree.fromList([0, 0, 0, 0, 0, 2, 3, 1], coord_bit_length, material_table)
+camera = {"camera_pos": cam_pos, "camera_front": cam_norm, "right_vector": cam_right, "up_vector": cam_up}
 
 # Image placeholder
 image = np.zeros((im_height, im_width, 3), dtype=np.uint8)
@@ -20,28 +27,18 @@ image = np.zeros((im_height, im_width, 3), dtype=np.uint8)
 def roundPosition(position):
     return np.round(position).astype(int)
 
-def toBinaryStr(value, bit_length):
-    return format(value, f'0{bit_length}b')
-
 def withinAABB(position, aabb_min, aabb_max):
     return np.all(position >= aabb_min) and np.all(position <= aabb_max)
 
 def justOutsideAABB(position, aabb_min, aabb_max):
     return np.any(position == aabb_min - 1) or np.any(position == aabb_max + 1)
 
-def traverseTree(ray_pos, node, oct_size, aabb_min, aabb_max):
-    depth = 0
-    x_bin = toBinaryStr(ray_pos[0], coord_bit_length)
-    y_bin = toBinaryStr(ray_pos[1], coord_bit_length)
-    z_bin = toBinaryStr(ray_pos[2], coord_bit_length)
-    while isinstance(node, list) and depth < coord_bit_length:
-        octant = int(z_bin[depth] + y_bin[depth] + x_bin[depth], 2)
-        depth += 1
-        oct_size /= 2
-        aabb_min = aabb_min + (oct_size * np.array([int(x_bin[depth - 1]), int(y_bin[depth - 1]), int(z_bin[depth - 1])])).astype(int)
-        aabb_max = aabb_min + np.array([oct_size - 1, oct_size - 1, oct_size - 1]).astype(int)
-        node = node[octant]
-    return node, oct_size, aabb_min, aabb_max
+def traverseTree(ray_pos, octree, oct_size, aabb_min, aabb_max):
+    node, depth = octree.descend(int(ray_pos[0]), int(ray_pos[1]), int(ray_pos[2]))
+    oct_size = int(oct_size) >> depth
+    aabb_min = aabb_min + ((ray_pos - aabb_min) & -oct_size)
+    aabb_max = aabb_min + (oct_size - 1)
+    return node & MATERIAL_MASK, oct_size, aabb_min, aabb_max
 
 def stepRay(ray_pos, ray_dir, oct_size, aabb_min, aabb_max):
     while np.linalg.norm(ray_dir) < oct_size:
@@ -54,65 +51,88 @@ def stepRay(ray_pos, ray_dir, oct_size, aabb_min, aabb_max):
         ray_dir /= 2
     return ray_pos
 
-def apply_gamma_correction(color, gamma=2.2):
-    return np.clip(255 * (color / 255) ** (1 / gamma), 0, 255).astype(np.uint8)
-
-total_pixels = im_height * im_width
-
-with tqdm(total=total_pixels, desc="Rendering", unit="pixel") as pbar:
-    for y in range(im_height):
-        for x in range(im_width):
-            centered_x = x - (im_width / 2)
-            centered_y = (im_height / 2) - y
-            ray_dir = (cam_right * centered_x + cam_up * centered_y + cam_norm)
-            ray_dir = ray_dir / np.linalg.norm(ray_dir)
-            ray_pos = np.copy(cam_pos)
-            ray_pos = roundPosition(ray_pos)
-            
-            world_size = 2**coord_bit_length
-            world_min = np.array([0, 0, 0], dtype=int)
-            world_max = np.array([world_size - 1, world_size - 1, world_size - 1], dtype=int)
-            aabb_min = world_min
-            aabb_max = world_max
-            root = octree
-
-            while withinAABB(ray_pos, world_min, world_max):
-                mid, oct_size, aabb_min, aabb_max = traverseTree(ray_pos, root, world_size, world_min, world_max)
-                if mid == 0:
-                    ray_pos = stepRay(ray_pos, ray_dir, oct_size, aabb_min, aabb_max)
-                if mid > 0:
-                    hit_normal = np.array([0, 0, 0])
-                    if ray_pos[0] == aabb_min[0]:
-                        hit_normal = np.array([-1, 0, 0])
-                    elif ray_pos[0] == aabb_max[0]:
-                        hit_normal = np.array([1, 0, 0])
-                    elif ray_pos[1] == aabb_min[1]:
-                        hit_normal = np.array([0, -1, 0])
-                    elif ray_pos[1] == aabb_max[1]:
-                        hit_normal = np.array([0, 1, 0])
-                    elif ray_pos[2] == aabb_min[2]:
-                        hit_normal = np.array([0, 0, -1])
-                    elif ray_pos[2] == aabb_max[2]:
-                        hit_normal = np.array([0, 0, 1])
-                    
-                    light_dir = cam_pos - ray_pos
-                    light_dir = light_dir / np.linalg.norm(light_dir)
-                    
-                    brightness_factor = (np.dot(light_dir, hit_normal))**2
-                    
-                    colour = np.array(material_table[mid]) * brightness_factor
-                    colour = np.clip(colour, 0, 255).astype(np.uint8)
-                    colour = apply_gamma_correction(colour)
-                    
-                    break
-            else:
-                colour = [0, 0, 0]
-            
-            image[y, x] = colour
-            
-            pbar.update(1)
-
-print("done")
-img = Image.fromarray(image, 'RGB')
-img.save('ray_traced_image.png')
-img.show()
\ No newline at end of file
+def apply_gamma_correction(color):
+    # Table of 255 * (c / 255) ** (1 / 2.2) for every uint8 value
+    return gamma_table[color]
+
+def shadeHit(mid, ray_pos, aabb_min, aabb_max):
+    hit_normal = np.array([0, 0, 0])
+    if ray_pos[0] == aabb_min[0]:
+        hit_normal = np.array([-1, 0, 0])
+    elif ray_pos[0] == aabb_max[0]:
+        hit_normal = np.array([1, 0, 0])
+    elif ray_pos[1] == aabb_min[1]:
+        hit_normal = np.array([0, -1, 0])
+    elif ray_pos[1] == aabb_max[1]:
+        hit_normal = np.array([0, 1, 0])
+    elif ray_pos[2] == aabb_min[2]:
+        hit_normal = np.array([0, 0, -1])
+    elif ray_pos[2] == aabb_max[2]:
+        hit_normal = np.array([0, 0, 1])
+    
+    light_dir = cam_pos - ray_pos
+    light_dir = light_dir / np.linalg.norm(light_dir)
+    
+    brightness_factor = (np.dot(light_dir, hit_normal))**2
+    
+    colour = np.array(material_table[mid]) * brightness_factor
+    colour = np.clip(colour, 0, 255).astype(np.uint8)
+    return apply_gamma_correction(colour)
+
+def traceRay(ray_pos, ray_dir, root):
+    world_size = 2**coord_bit_length
+    world_min = np.array([0, 0, 0], dtype=int)
+    world_max = np.array([world_size - 1, world_size - 1, world_size - 1], dtype=int)
+
+    while withinAABB(ray_pos, world_min, world_max):
+        mid, oct_size, aabb_min, aabb_max = traverseTree(ray_pos, root, world_size, world_min, world_max)
+        if mid == 0:
+            ray_pos = stepRay(ray_pos, ray_dir, oct_size, aabb_min, aabb_max)
+        if mid > 0:
+            return shadeHit(mid, ray_pos, aabb_min, aabb_max)
+    return [0, 0, 0]
+
+def renderReference():
+    total_pixels = im_height * im_width
+
+    with tqdm(total=total_pixels, desc="Rendering", unit="pixel") as pbar:
+        for y in range(im_height):
+            for x in range(im_width):
+                centered_x = x - (im_width / 2)
+                centered_y = (im_height / 2) - y
+                ray_dir = (cam_right * centered_x + cam_up * centered_y + cam_norm)
+                ray_dir = ray_dir / np.linalg.norm(ray_dir)
+                ray_pos = np.copy(cam_pos)
+                ray_pos = roundPosition(ray_pos)
+
+                image[y, x] = traceRay(ray_pos, ray_dir, octree)
+                
+                pbar.update(1)
+
+def main():
+    args = RayTracer.parseArguments("Software ray tracer with shading", camera, shading=True, reference=reference)
+
+    if reference:
+        renderReference()
+        frame = image
+    else:
+        scene = Octree.load(args.scene, coord_bit_length) if args.scene else octree
+        view = {"camera_pos": args.pos, "camera_front": args.dir, "right_vector": args.right, "up_vector": args.up}
+        stats = {} if args.stats else None
+        options = {'shading': args.shading, 'workers': args.workers, 'step_mode': args.step_mode, 'stats': stats, 'packet_size': args.packet, 'hardware_rays': args.hardware_rays, 'lod': args.lod}
+        if args.preview:
+            frame = RayTracer.upscale(RayTracer.renderPreview(scene, view, args.width, args.height, args.preview, **options), args.width, args.height)
+        else:
+            frame = RayTracer.render(scene, view, args.width, args.height, **options)
+        if stats is not None:
+            RayStats.printSummary(stats)
+            RayStats.saveStats(stats, args.stats)
+
+    print("done")
+    img = Image.fromarray(frame, 'RGB')
+    img.save(args.output)
+    if args.show:
+        img.show()
+
+if __name__ == "__main__":
+    main()
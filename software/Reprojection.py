@@ -0,0 +1,151 @@
+import numpy as np
+
+import RayTracerBatch
+
+# Temporal reprojection for small camera moves. The point every ray of the last
+# frame stopped at (a voxel face, or where it left the world) is kept with its
+# leaf and material; for the next camera each point is projected to the pixel
+# it now falls in, the nearest one wins, and only pixels that get no point
+# (disoccluded, or newly in view) or whose accumulated sub-pixel error is over
+# max_error are traced again. A hit is only reused if the new pixel's ray
+# still passes through the hit leaf, and it is moved to where that ray enters
+# the leaf, so shading is recomputed for the new camera on the right face.
+# How close a frame comes to a full render depends on the stepping: with dda,
+# flat frames differ in about 0.2-0.3% of pixels, with the hardware steps
+# (which end a ray at different points depending on where it started) in
+# about 3.6% (benchmarks/reprojection.py, house.mem). Shaded frames are only
+# approximate in either mode, about 18% of pixels differ slightly, as the
+# stepped rays end a voxel or so away from the exact entry point and the light
+# direction follows the hit position.
+# Geometry that was hidden or out of view in the last frame can still be
+# missed; the error bound limits how long a pixel can go without a fresh ray.
+
+
+def projectPoints(points, cam_pos, cam_norm, cam_up, cam_right, im_width, im_height):
+    # Returns the (x, y) image position of every point and its distance along
+    # the camera direction (<= 0 behind the camera), or None if the camera
+    # vectors do not span 3D
+    basis = np.column_stack([cam_right, cam_up, cam_norm]).astype(np.float64)
+    if abs(np.linalg.det(basis)) < 1e-9:
+        return None
+    # ray = centered_x * right + centered_y * up + norm, scaled by depth
+    right, up, depth = np.linalg.solve(basis, (points - cam_pos).T)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = right / depth + im_width / 2
+        y = im_height / 2 - up / depth
+    return x, y, depth
+
+
+def enterLeaves(cam_pos, ray_dir, leaf_min, leaf_max):
+    # Slab test of each ray against its leaf (half a unit past the outer
+    # voxels, as stepRayDDA). Returns whether the ray passes through the leaf
+    # and the voxel it enters through, on the face it crosses
+    low, high = leaf_min - 0.5, leaf_max + 0.5
+    with np.errstate(divide='ignore', invalid='ignore'):
+        near = (np.where(ray_dir > 0, low, high) - cam_pos) / ray_dir
+        far = (np.where(ray_dir > 0, high, low) - cam_pos) / ray_dir
+    # A ray parallel to a slab is inside it everywhere or nowhere
+    inside = (cam_pos >= low) & (cam_pos <= high)
+    near = np.where(ray_dir == 0, np.where(inside, -np.inf, np.inf), near)
+    far = np.where(ray_dir == 0, np.where(inside, np.inf, -np.inf), far)
+    t_near, t_far = near.max(axis=1), far.min(axis=1)
+    through = (t_near <= t_far) & (t_near > 0)
+
+    axis = near.argmax(axis=1)
+    rows = np.arange(len(ray_dir))
+    entry = np.clip(np.round(cam_pos + np.where(through, t_near, 0)[:, None] * ray_dir), leaf_min, leaf_max).astype(np.int64)
+    entry[rows, axis] = np.where(ray_dir[rows, axis] > 0, leaf_min[rows, axis], leaf_max[rows, axis])
+    return through, entry
+
+
+class Reprojector:
+    def __init__(self, octree, im_width, im_height, shading=False, step_mode='dda', max_error=1.0, min_reuse=0.25):
+        # max_error: sub-pixel distance (in pixels, summed over the frames a
+        # pixel has been carried) above which a pixel is traced again.
+        # min_reuse: below this share of reusable pixels the frame is traced in full
+        self.octree = octree
+        self.im_width = im_width
+        self.im_height = im_height
+        self.shading = shading
+        self.step_mode = step_mode
+        self.max_error = max_error
+        self.min_reuse = min_reuse
+        self.material = None  # nothing to reproject yet
+        self.reused = 0.0  # share of the last frame's pixels that were reprojected
+
+    def trace(self, view, pixels):
+        # Traces the rays of the given pixel indices into the frame buffers
+        ray_pos, ray_dir = RayTracerBatch.cameraRays(*view, self.im_width, self.im_height)
+        ray_pos, ray_dir = ray_pos[pixels], ray_dir[pixels]
+        if self.shading:
+            ray_dir = ray_dir / np.linalg.norm(ray_dir, axis=1)[:, None]
+        material, hit_pos, hit_min, hit_max = RayTracerBatch.traceRays(self.octree, ray_pos, ray_dir, self.step_mode)
+        self.material[pixels] = material
+        self.hit_pos[pixels] = hit_pos
+        self.hit_min[pixels] = hit_min
+        self.hit_max[pixels] = hit_max
+        self.error[pixels] = 0
+
+    def reproject(self, view):
+        # Moves the kept points to their pixels for the new camera, returns the
+        # pixels that are left without one
+        projected = projectPoints(self.hit_pos, *view, self.im_width, self.im_height)
+        if projected is None:
+            return np.arange(self.im_width * self.im_height)
+        x, y, depth = projected
+        with np.errstate(invalid='ignore'):
+            column, row = np.round(x), np.round(y)
+            error = self.error + np.maximum(np.abs(x - column), np.abs(y - row))
+            usable = (depth > 0) & (column >= 0) & (column < self.im_width) & (row >= 0) & (row < self.im_height) & (error <= self.max_error)
+        source = np.nonzero(usable)[0]
+        target = row[source].astype(np.int64) * self.im_width + column[source].astype(np.int64)
+        # Nearest point per pixel: sort by pixel, then depth, and keep the first
+        order = np.lexsort((depth[source], target))
+        target, first = np.unique(target[order], return_index=True)
+        source = source[order][first]
+
+        # A hit has to lie on the new pixel's ray, else the pixel is traced
+        hits = np.nonzero(self.material[source] > 0)[0]
+        ray_dir = RayTracerBatch.cameraRays(*view, self.im_width, self.im_height)[1][target[hits]]
+        through, entry = enterLeaves(view[0], ray_dir, self.hit_min[source[hits]], self.hit_max[source[hits]])
+        self.hit_pos[source[hits]] = entry
+        kept = np.ones(len(source), dtype=bool)
+        kept[hits] = through
+        source, target = source[kept], target[kept]
+
+        buffers = (self.material, self.hit_pos, self.hit_min, self.hit_max)
+        self.material, self.hit_pos, self.hit_min, self.hit_max = (np.zeros_like(buffer) for buffer in buffers)
+        for old, new in zip(buffers, (self.material, self.hit_pos, self.hit_min, self.hit_max)):
+            new[target] = old[source]
+        self.error = np.full(len(error), np.inf)
+        self.error[target] = error[source]
+        return np.nonzero(np.isinf(self.error))[0]
+
+    def render(self, camera, background=None):
+        # camera is a dict like the gui.py presets; returns the (height, width, 3) frame
+        view = [np.asarray(camera[key]) for key in ("camera_pos", "camera_front", "up_vector", "right_vector")]
+        pixel_count = self.im_width * self.im_height
+        missing = None
+        if self.material is not None:
+            missing = self.reproject(view)
+            if 1 - len(missing) / pixel_count < self.min_reuse:
+                missing = None
+        if missing is None:
+            self.material = np.zeros(pixel_count, dtype=np.int64)
+            self.hit_pos = np.zeros((pixel_count, 3), dtype=np.int64)
+            self.hit_min = np.zeros((pixel_count, 3), dtype=np.int64)
+            self.hit_max = np.zeros((pixel_count, 3), dtype=np.int64)
+            self.error = np.zeros(pixel_count)
+            missing = np.arange(pixel_count)
+        self.trace(view, missing)
+        self.reused = 1 - len(missing) / pixel_count
+
+        if self.shading:
+            image = RayTracerBatch.shadeHits(self.octree.materials, view[0], self.material, self.hit_pos, self.hit_min, self.hit_max)
+        else:
+            image = np.array(self.octree.materials, dtype=np.uint8)[self.material]
+        image[self.material == 0] = background if background is not None else 0
+        return image.reshape(self.im_height, self.im_width, 3)
+
+    def hitMask(self):
+        return (self.material > 0).reshape(self.im_height, self.im_width)
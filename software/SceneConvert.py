@@ -0,0 +1,75 @@
+import argparse
+import os
+import time
+from itertools import islice
+
+import numpy as np
+
+from Octree import HARDWARE_MATERIALS, LEAF_FLAG, SCENE_HEADER, SCENE_MAGIC, Octree, readSceneHeader, sceneHeader
+
+# Converts between the .mem hex files OctantRom.sv loads and binary scene files
+# (see SCENE_HEADER in Octree.py) that Octree.load memory maps. Both directions
+# stream a chunk of words at a time, so scenes larger than memory convert too,
+# and .mem -> scene -> .mem gives back the same words. The text is rewritten
+# the way mem-parser.py writes it (one word per line, pointers lower case,
+# leaves upper case), so hand-edited files such as rtl/cubes.mem with trailing
+# spaces do not come back byte for byte.
+
+# Words converted per chunk
+chunk_words = 1 << 20
+
+
+def memToScene(mem_path, scene_path, coord_bit_length=10, materials=HARDWARE_MATERIALS):
+    count = 0
+    root = None
+    with open(mem_path, 'r') as lines, open(scene_path, 'wb') as file:
+        # The node count and root are only known at the end, the header is rewritten then
+        file.write(bytes(SCENE_HEADER.size))
+        while True:
+            words = [word for line in islice(lines, chunk_words) for word in line.split()]
+            if not words:
+                break
+            chunk = np.array([int(word, 16) for word in words], dtype='<u4')
+            if root is None:
+                root = int(chunk[0])
+            chunk.tofile(file)
+            count += len(chunk)
+        if root is None:
+            raise ValueError(f"{mem_path}: no words")
+        file.seek(0)
+        file.write(sceneHeader(count, root, coord_bit_length, materials))
+    return count
+
+
+def sceneToMem(scene_path, mem_path):
+    # Same text as Octree.toMem: pointers in lower case, leaves in upper case, no trailing newline
+    nodes = Octree.fromScene(scene_path).nodes
+    with open(mem_path, 'w') as file:
+        for start in range(0, len(nodes), chunk_words):
+            text = "\n".join([f"{word:08X}" if word & LEAF_FLAG else f"{word:08x}" for word in nodes[start:start + chunk_words].tolist()])
+            file.write(text if start == 0 else "\n" + text)
+    return len(nodes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a .mem octree to a memory mappable scene file or back; the direction follows the input")
+    parser.add_argument('input', help=".mem or scene file")
+    parser.add_argument('output')
+    parser.add_argument('--bits', type=int, default=10, help="coordinate bit length stored in the scene header")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with open(args.input, 'rb') as file:
+        is_scene = file.read(len(SCENE_MAGIC)) == SCENE_MAGIC
+    if is_scene:
+        count = sceneToMem(args.input, args.output)
+    else:
+        count = memToScene(args.input, args.output, args.bits)
+    elapsed = time.perf_counter() - start
+    header = readSceneHeader(args.output if not is_scene else args.input)
+    print(f"{count} nodes, {header['coord_bit_length']} bit coordinates, root at {header['root']:08x}: "
+          f"{os.path.getsize(args.input)} -> {os.path.getsize(args.output)} bytes in {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import argparse
+
+import numpy as np
+
+import RayTracerBatch
+from Octree import Octree
+
+# Frame time projection for RayTracingUnit.sv with any number of RayProcessor
+# cores, without running the RTL. Each ray is traced once in software
+# (RayTracerBatch, hardware step mode) to count its octree lookups, levels
+# descended, direction doublings and step iterations; those are turned into
+# cycles with the state machine of RayProcessor.sv and the rays are then dealt
+# out to the cores the way RayGenerator.sv / PixelBuffer.sv do it.
+#
+# The counts come from the software stepping, which keeps the halved direction
+# between lookups where the RTL reloads the camera ray, so this is a projection
+# rather than a cycle-exact replay.
+
+# Cycles per event, one per RayProcessor.sv state visited
+ray_setup_cycles = 3        # INITIALISE, IDLE until RayGenerator has the next ray
+lookup_cycles = 4           # RAY_TRAVERSE_INITIALISE, RAY_TRAVERSE_OCTANT_NO and CHECK_STATE at the leaf, RAY_PREP_STEP
+level_cycles = 5            # RAY_TRAVERSE_OCTANT_NO, CHECK_STATE, FIND_OCTANT, UPDATE_MIN, UPDATE_MAX
+size_check_cycles = 1       # RAY_STEP_ADJUST_DIR_VEC finding the direction long enough
+doubling_cycles = 2         # RAY_STEP_ADJUST_DIR_VEC, RAY_PREP_STEP
+step_cycles = 5             # RAY_STEP_TEMP, RAY_STEP_CHECK_POSITION, RAY_STEP_CHECK_AABB, STALL, RAY_STEP_INSIDE / OUTSIDE
+shading_cycles = 4 + 2 * 16 + 2   # COLOUR_FORMAT to SQRT_INIT, 16 SQRT_ITER + buffer, SHADING_3_INIT, SHADING_4
+normalise_cycles = 2        # SHADING_3, SHADING_3_BUFFER per shift of sqrt_res
+miss_cycles = 1             # RAY_OUT_OF_BOUND
+output_cycles = 2           # OUTPUT_COLOUR_INIT, OUTPUT_COLOUR
+write_cycles = 1            # PixelBuffer WRITE_PIXEL, assuming the stream is always ready
+
+# Default frame size, --width / --height project others (the board and
+# RayTracingUnit_tb.cpp render 512 x 512)
+im_width = 256
+im_height = 256
+
+
+def normaliseShifts(cam_pos, hit_pos):
+    # SHADING_3 shifts the integer sqrt of the squared camera distance right by
+    # up to 10 bits at a time until it is at most 1
+    light_dir = np.asarray(cam_pos) - hit_pos
+    sqrt_res = np.floor(np.sqrt((light_dir * light_dir).sum(axis=1))).astype(np.int64)
+    shifts = np.zeros(len(hit_pos), dtype=np.int64)
+    active = sqrt_res > 1
+    while active.any():
+        sqrt_res[active] >>= np.minimum(np.log2(sqrt_res[active]).astype(np.int64), 10)
+        shifts[active] += 1
+        active = sqrt_res > 1
+    return shifts
+
+
+def rayCycles(octree, cam_pos, cam_norm, cam_up, cam_right, width=im_width, height=im_height):
+    # Returns the RayProcessor cycles of every pixel in raster order and a dict
+    # of cycles per phase over the whole frame
+    ray_pos, ray_dir = RayTracerBatch.cameraRays(cam_pos, cam_norm, cam_up, cam_right, width, height)
+    stats = {}
+    material, hit_pos, _, _ = RayTracerBatch.traceRays(octree, ray_pos, ray_dir, 'hardware', stats)
+    hit = material > 0
+
+    empty_lookups = stats['lookups'] - hit
+    phases = {
+        'setup': np.full(len(material), ray_setup_cycles + output_cycles),
+        'traversal': stats['lookups'] * lookup_cycles + stats['levels'] * level_cycles,
+        'direction': empty_lookups * size_check_cycles + stats['doublings'] * doubling_cycles,
+        'stepping': stats['steps'] * step_cycles,
+        'shading': np.where(hit, shading_cycles, miss_cycles),
+    }
+    phases['shading'][hit] += normaliseShifts(cam_pos, hit_pos[hit]) * normalise_cycles
+    cycles = sum(phases.values())
+    return cycles, {phase: int(total.sum()) for phase, total in phases.items()}
+
+
+def frameCycles(cycles, cores):
+    # Pixel i goes to core i % cores and PixelBuffer takes the cores' outputs
+    # strictly in turn, so a core that finishes early waits for the one before
+    # it before it can start its next ray
+    free = [0] * cores
+    written = 0
+    for i, ray in enumerate(cycles.tolist()):
+        core = i % cores
+        done = free[core] + ray
+        free[core] = max(done, written) + 1
+        written = free[core] + write_cycles
+    return written
+
+
+def coreLoads(cycles, cores):
+    # Cycles each core spends on its own rays, ignoring the in-order output
+    return np.bincount(np.arange(len(cycles)) % cores, weights=cycles, minlength=cores)
+
+
+def project(cycles, core_counts, clock_hz):
+    rows = []
+    for cores in core_counts:
+        frame = frameCycles(cycles, cores)
+        loads = coreLoads(cycles, cores)
+        rows.append({
+            'cores': cores,
+            'cycles': frame,
+            'fps': clock_hz / frame,
+            'busiest_core': int(loads.max()),
+            'imbalance': loads.max() / loads.mean() - 1,
+            'ordering_stall': frame / loads.max() - 1,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Project RayTracingUnit frame time for a number of cores")
+    parser.add_argument('scene', help=".mem or scene file, e.g. ../rtl/house.mem")
+    parser.add_argument('--pos', type=int, nargs=3, default=[250, 512, 0])
+    parser.add_argument('--dir', type=int, nargs=3, default=[0, 0, 100])
+    parser.add_argument('--right', type=int, nargs=3, default=[1, 0, 0])
+    parser.add_argument('--up', type=int, nargs=3, default=[0, 1, 0])
+    parser.add_argument('--width', type=int, default=im_width)
+    parser.add_argument('--height', type=int, default=im_height)
+    parser.add_argument('--cores', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--clock-mhz', type=float, default=100.0)
+    args = parser.parse_args()
+
+    octree = Octree.load(args.scene)
+    cycles, phases = rayCycles(octree, np.array(args.pos), np.array(args.dir), np.array(args.up), np.array(args.right),
+                              args.width, args.height)
+
+    total = sum(phases.values())
+    print(f"{len(cycles)} rays, {cycles.mean():.0f} cycles/ray on average, worst {cycles.max()}")
+    print("  " + ", ".join(f"{phase} {count / total * 100:.1f}%" for phase, count in phases.items()))
+    print(f"{'cores':>5s} {'cycles/frame':>13s} {'fps':>8s} {'imbalance':>10s} {'ordering stall':>15s}")
+    for row in project(cycles, args.cores, args.clock_mhz * 1e6):
+        print(f"{row['cores']:5d} {row['cycles']:13d} {row['fps']:8.1f} {row['imbalance'] * 100:9.1f}% {row['ordering_stall'] * 100:14.1f}%")
+
+
+if __name__ == "__main__":
+    main()
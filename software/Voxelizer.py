@@ -0,0 +1,301 @@
+import argparse
+import sys
+
+import numpy as np
+
+from Octree import LEAF_FLAG, LEAF_PREFIX, MATERIAL_MASK, Octree, mortonTable
+
+# Builds a .mem octree from an OBJ / PLY mesh or a point cloud without Unity:
+#   1. the model is scaled into the 2^coord_bit_length grid
+#   2. triangles are sampled at under half a voxel spacing (points are taken as
+#      they are) and every sample becomes a Morton code with its material
+#   3. the octree is built bottom-up from the sorted codes: each level groups
+#      nodes by parent, a parent whose 8 children are the same leaf becomes that
+#      leaf, and the levels are laid out breadth first like mem-parser.py does
+# Only occupied voxels are held (8 byte code + material each), never the dense
+# grid, and triangles are sampled in chunks, so memory follows the voxel count.
+
+# Samples generated per chunk of triangles
+chunk_samples = 1 << 22
+
+default_material = 1
+
+
+def checkMaterials(path, materials):
+    # Material ids have to fit the 3 bits of a leaf word (0 is empty); larger
+    # ones would spill into the Morton code in voxelize. Returns them as uint8
+    materials = np.asarray(materials)
+    bad = (materials != np.round(materials)) | (materials < 1) | (materials > MATERIAL_MASK)
+    if bad.any():
+        raise ValueError(f"{path}: material ids must be whole numbers from 1 to {MATERIAL_MASK}, got {materials[bad][0].item():g}")
+    return materials.astype(np.uint8)
+
+
+def loadObj(path, materials, fallback=default_material):
+    # Returns vertices (N, 3), triangles (M, 3) and a material id per triangle.
+    # Polygons are split into fans, usemtl names are looked up in materials
+    vertices, triangles, triangle_materials = [], [], []
+    material = fallback
+    unknown = set()
+    with open(path, 'r') as file:
+        for line in file:
+            parts = line.split()
+            if not parts:
+                continue
+            if parts[0] == 'v':
+                vertices.append([float(value) for value in parts[1:4]])
+            elif parts[0] == 'f':
+                indices = [int(part.split('/')[0]) for part in parts[1:]]
+                indices = [index - 1 if index > 0 else len(vertices) + index for index in indices]
+                for i in range(1, len(indices) - 1):
+                    triangles.append([indices[0], indices[i], indices[i + 1]])
+                    triangle_materials.append(material)
+            elif parts[0] == 'usemtl':
+                name = line.strip()[len('usemtl'):].strip()
+                if name not in materials and name not in unknown:
+                    print(f"{path}: no material id for {name!r}, using {fallback}", file=sys.stderr)
+                    unknown.add(name)
+                material = materials.get(name, fallback)
+    return (np.array(vertices, dtype=np.float64).reshape(-1, 3), np.array(triangles, dtype=np.int64).reshape(-1, 3),
+            np.array(triangle_materials, dtype=np.uint8))
+
+
+ply_types = {
+    'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1', 'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4', 'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8',
+}
+
+
+def loadPly(path, fallback=default_material):
+    # ASCII or binary PLY, returns vertices, triangles and their materials. A
+    # 'material' property on faces (or on vertices of a point cloud) is used as
+    # the material id
+    with open(path, 'rb') as file:
+        if file.readline().strip() != b'ply':
+            raise ValueError(f"{path} is not a PLY file")
+        elements = []
+        file_format = None
+        while True:
+            words = file.readline().decode('ascii').split()
+            if not words or words[0] == 'comment':
+                continue
+            if words[0] == 'end_header':
+                break
+            if words[0] == 'format':
+                file_format = words[1]
+            elif words[0] == 'element':
+                elements.append((words[1], int(words[2]), []))
+            elif words[0] == 'property':
+                elements[-1][2].append(tuple(words[1:]))
+        if file_format not in ('ascii', 'binary_little_endian', 'binary_big_endian'):
+            raise ValueError(f"{path}: unsupported PLY format {file_format}")
+        endian = '>' if file_format == 'binary_big_endian' else '<'
+
+        data = {}
+        for name, count, properties in elements:
+            if file_format == 'ascii':
+                data[name] = readPlyAscii(file, count, properties)
+            else:
+                data[name] = readPlyBinary(file, count, properties, endian)
+
+    vertex = data['vertex']
+    vertices = np.stack([vertex['x'], vertex['y'], vertex['z']], axis=1).astype(np.float64)
+    faces = data.get('face')
+    if faces is None or not len(faces.get('vertex_indices', faces.get('vertex_index', []))):
+        materials = vertex['material'] if 'material' in vertex else np.full(len(vertices), fallback)
+        return vertices, None, checkMaterials(path, materials)
+    polygons = faces.get('vertex_indices', faces.get('vertex_index'))
+    face_materials = checkMaterials(path, faces['material'] if 'material' in faces else np.full(len(polygons), fallback))
+    triangles, triangle_materials = [], []
+    for polygon, material in zip(polygons, face_materials):
+        for i in range(1, len(polygon) - 1):
+            triangles.append([polygon[0], polygon[i], polygon[i + 1]])
+            triangle_materials.append(material)
+    return vertices, np.array(triangles, dtype=np.int64).reshape(-1, 3), np.array(triangle_materials, dtype=np.uint8)
+
+
+def readPlyAscii(file, count, properties):
+    columns = {prop[-1]: [] for prop in properties}
+    for _ in range(count):
+        values = file.readline().split()
+        position = 0
+        for prop in properties:
+            if prop[0] == 'list':
+                length = int(values[position])
+                columns[prop[-1]].append([int(value) for value in values[position + 1:position + 1 + length]])
+                position += 1 + length
+            else:
+                columns[prop[-1]].append(float(values[position]))
+                position += 1
+    return {name: values if any(prop[0] == 'list' and prop[-1] == name for prop in properties) else np.array(values)
+            for name, values in columns.items()}
+
+
+def readPlyBinary(file, count, properties, endian):
+    if not any(prop[0] == 'list' for prop in properties):
+        dtype = np.dtype([(prop[-1], endian + ply_types[prop[0]]) for prop in properties])
+        array = np.frombuffer(file.read(dtype.itemsize * count), dtype=dtype, count=count)
+        return {name: array[name] for name in dtype.names}
+    # Lists (faces): read row by row
+    columns = {prop[-1]: [] for prop in properties}
+    for _ in range(count):
+        for prop in properties:
+            if prop[0] == 'list':
+                count_type = np.dtype(endian + ply_types[prop[1]])
+                length = int(np.frombuffer(file.read(count_type.itemsize), dtype=count_type)[0])
+                item_type = np.dtype(endian + ply_types[prop[2]])
+                columns[prop[-1]].append(np.frombuffer(file.read(item_type.itemsize * length), dtype=item_type).tolist())
+            else:
+                value_type = np.dtype(endian + ply_types[prop[0]])
+                columns[prop[-1]].append(np.frombuffer(file.read(value_type.itemsize), dtype=value_type)[0])
+    return columns
+
+
+def loadPoints(path, fallback=default_material):
+    # Whitespace separated x y z [material] per line
+    points = np.loadtxt(path, ndmin=2)
+    materials = points[:, 3] if points.shape[1] > 3 else np.full(len(points), fallback)
+    return points[:, :3], None, checkMaterials(path, materials)
+
+
+def fitToGrid(vertices, coord_bit_length=10, size=None, offset=(0, 0, 0)):
+    # Scales the model so its largest side spans size voxels (the whole grid by
+    # default) and moves its minimum corner to offset
+    grid = 1 << coord_bit_length
+    size = grid if size is None else size
+    low = vertices.min(axis=0)
+    extent = (vertices.max(axis=0) - low).max()
+    scale = (size - 1e-6) / extent if extent > 0 else 1.0
+    return (vertices - low) * scale + np.asarray(offset, dtype=np.float64)
+
+
+def sampleTriangles(vertices, triangles, materials):
+    # Yields (points, materials) chunks covering every triangle with samples
+    # at most half a voxel apart along each barycentric direction
+    corners = vertices[triangles]
+    edges = np.stack([np.linalg.norm(corners[:, 1] - corners[:, 0], axis=1),
+                      np.linalg.norm(corners[:, 2] - corners[:, 0], axis=1),
+                      np.linalg.norm(corners[:, 2] - corners[:, 1], axis=1)], axis=1)
+    steps = np.maximum(np.ceil(edges.max(axis=1) * 2), 1).astype(np.int64)
+    counts = (steps + 1) * (steps + 2) // 2
+
+    start = 0
+    while start < len(triangles):
+        end = start + max(1, int(np.searchsorted(np.cumsum(counts[start:]), chunk_samples)))
+        triangle = np.repeat(np.arange(start, end), counts[start:end])
+        # Index of each sample within its triangle -> (i, j) with i + j <= steps
+        first = np.repeat(np.cumsum(counts[start:end]) - counts[start:end], counts[start:end])
+        k = np.arange(len(triangle)) - first
+        n = steps[triangle]
+        # Row i holds n + 1 - i samples; invert the running row lengths
+        i = np.floor(((2 * n + 3) - np.sqrt((2 * n + 3) ** 2 - 8 * k)) / 2).astype(np.int64)
+        # Fix the odd off by one from rounding in the square root
+        i[i * (2 * n + 3 - i) // 2 > k] -= 1
+        i[(i + 1) * (2 * n + 2 - i) // 2 <= k] += 1
+        row_start = i * (2 * n + 3 - i) // 2
+        j = k - row_start
+        u = (i / n)[:, None]
+        v = (j / n)[:, None]
+        a, b, c = corners[triangle, 0], corners[triangle, 1], corners[triangle, 2]
+        yield a + (b - a) * u + (c - a) * v, materials[triangle]
+        start = end
+
+
+def mortonCodes(points, coord_bit_length=10):
+    # Voxel coordinates outside the grid are dropped
+    voxels = np.floor(points).astype(np.int64)
+    inside = np.all((voxels >= 0) & (voxels < (1 << coord_bit_length)), axis=1)
+    voxels = voxels[inside]
+    table = np.array(mortonTable(coord_bit_length), dtype=np.int64)
+    return table[voxels[:, 0]] | table[voxels[:, 1]] << 1 | table[voxels[:, 2]] << 2, inside
+
+
+def voxelize(chunks, coord_bit_length=10):
+    # Returns sorted unique Morton codes and their materials; where several
+    # materials land in one voxel the lowest id wins
+    keys = np.zeros(0, dtype=np.int64)
+    for points, materials in chunks:
+        checkMaterials('voxelize', materials)
+        codes, inside = mortonCodes(points, coord_bit_length)
+        materials = materials[inside].astype(np.int64)
+        chunk_keys = np.unique(codes << 3 | materials)
+        keys = np.union1d(keys, chunk_keys[chunk_keys & MATERIAL_MASK > 0])
+    codes = keys >> 3
+    first = np.concatenate(([True], codes[1:] != codes[:-1]))
+    return codes[first], (keys[first] & MATERIAL_MASK).astype(np.uint32)
+
+
+def buildOctree(codes, materials, coord_bit_length=10):
+    # Bottom-up over the levels. A node is a leaf word (>= LEAF_FLAG) or the
+    # rank of an internal node within its level, which fixes its address once
+    # every level is known
+    empty = LEAF_PREFIX
+    if not len(codes):
+        return Octree(np.array([empty], dtype=np.uint32), coord_bit_length)
+    node = LEAF_PREFIX | materials.astype(np.int64)
+    level_blocks = []
+    for _ in range(coord_bit_length):
+        parents, first, inverse = np.unique(codes >> 3, return_index=True, return_inverse=True)
+        blocks = np.full((len(parents), 8), empty, dtype=np.int64)
+        blocks[inverse, codes & 7] = node
+        uniform = np.all(blocks == blocks[:, :1], axis=1) & (blocks[:, 0] >= LEAF_FLAG)
+        internal = ~uniform
+        node = np.where(uniform, blocks[:, 0], np.cumsum(internal) - 1)
+        level_blocks.append(blocks[internal])
+        codes = parents
+
+    if node[0] >= LEAF_FLAG:
+        return Octree(np.array([node[0]], dtype=np.uint32), coord_bit_length)
+
+    # Breadth first: the root level first, internal nodes of a level in Morton order
+    level_blocks.reverse()
+    offsets = np.cumsum([0] + [len(blocks) for blocks in level_blocks])
+    words = [np.array([1], dtype=np.int64)]
+    for depth, blocks in enumerate(level_blocks):
+        words.append(np.where(blocks >= LEAF_FLAG, blocks, 1 + 8 * (offsets[depth + 1] + blocks)).ravel())
+    return Octree(np.concatenate(words).astype(np.uint32), coord_bit_length)
+
+
+def parseMaterials(options):
+    materials = {}
+    for option in options:
+        name, _, material = option.rpartition('=')
+        if not name or not material.isdigit() or not 0 < int(material) <= MATERIAL_MASK:
+            raise ValueError(f"--material expects NAME=ID with an id from 1 to {MATERIAL_MASK}, got {option!r}")
+        materials[name] = int(material)
+    return materials
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Voxelize an OBJ / PLY mesh or a point cloud into a .mem octree")
+    parser.add_argument('input', help=".obj, .ply or a text point cloud (x y z [material] per line)")
+    parser.add_argument('output', help=".mem file to write")
+    parser.add_argument('--bits', type=int, default=10, help="coord_bit_length, the grid is 2^bits voxels a side")
+    parser.add_argument('--size', type=float, help="voxels spanned by the largest side of the model (default: the whole grid)")
+    parser.add_argument('--offset', type=float, nargs=3, default=[0, 0, 0], metavar=('X', 'Y', 'Z'), help="voxel position of the model's minimum corner")
+    parser.add_argument('--material', action='append', default=[], metavar='NAME=ID', help="material id for an OBJ usemtl name")
+    parser.add_argument('--default-material', type=int, default=default_material, help="material id when none is given")
+    args = parser.parse_args()
+    if not 0 < args.default_material <= MATERIAL_MASK:
+        parser.error(f"--default-material must be from 1 to {MATERIAL_MASK}")
+
+    if args.input.endswith('.obj'):
+        vertices, triangles, materials = loadObj(args.input, parseMaterials(args.material), args.default_material)
+    elif args.input.endswith('.ply'):
+        vertices, triangles, materials = loadPly(args.input, args.default_material)
+    else:
+        vertices, triangles, materials = loadPoints(args.input, args.default_material)
+
+    vertices = fitToGrid(vertices, args.bits, args.size, args.offset)
+    if triangles is None:
+        chunks = ((vertices[start:start + chunk_samples], materials[start:start + chunk_samples]) for start in range(0, len(vertices), chunk_samples))
+    else:
+        chunks = sampleTriangles(vertices, triangles, materials)
+    codes, voxel_materials = voxelize(chunks, args.bits)
+    octree = buildOctree(codes, voxel_materials, args.bits)
+    octree.toMem(args.output)
+    print(f"{len(codes)} voxels, {len(octree)} nodes written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()